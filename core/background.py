@@ -0,0 +1,102 @@
+"""
+Polynomial background fits for all columns of a 2-d spectral image at once.
+
+Fitting every column with np.polyfit (as in core.rst) sets up and factorises
+the same Vandermonde matrix of the background rows once per column. Here
+the design matrix is built once, and all columns are solved together as
+one matrix right-hand side:
+
+   x = np.append(np.arange(10, 200), np.arange(300, 480))
+   bkg, coeffs = fitBackground(img_cr, x, order=2)
+   img_bkg = img_cr - bkg
+
+Without weights this is a single QR factorisation and one matrix product.
+With per-pixel weights (from the ERR image) or masked pixels (from the DQ
+image or a cosmic-ray map) every column has its own weights, and the small
+(order+1)x(order+1) normal equations of all columns are built with one
+matrix product and solved in one batched call.
+
+Internally the rows are rescaled to [-1, 1] to keep the fits well
+conditioned; the coefficients returned are for the row number itself,
+highest power first, as from np.polyfit (so np.polyval(coeffs[:, col], x)
+gives the background of column col).
+"""
+import numpy
+from numpy.polynomial import polynomial
+
+
+# Scaled Vandermonde matrix of rows: (t^0, t^1, ..., t^order) with
+# t = (rows - centre)/halfWidth.
+def _vander(rows, order, centre, halfWidth):
+    return numpy.vander((numpy.asarray(rows, dtype=numpy.float64) - centre)/halfWidth,
+                        order + 1, increasing=True)
+
+
+# Matrix converting coefficients in t = (x - centre)/halfWidth (lowest power
+# first) into coefficients in x (highest power first, as np.polyfit).
+def _unscale(order, centre, halfWidth):
+    T = numpy.zeros((order + 1, order + 1))
+    for k in range(order + 1):
+        T[:k+1,k] = polynomial.polypow([-centre/halfWidth, 1.0/halfWidth], k)
+    return T[::-1]
+
+
+# Fit a polynomial of the given order along the columns of img, using only
+# the background rows.
+# img   ... 2-d image (or a LazyImage, see fits_images.py); only the rows
+#           listed in rows are read.
+# rows  ... indices of the background rows.
+# err   ... per-pixel errors (same shape as img, or its background rows);
+#           weights are 1/err^2, pixels with err <= 0 or NaN are ignored.
+# mask  ... True for bad pixels (e.g. dq != 0, or the cosmic-ray map),
+#           same shape as img or its background rows.
+# Returns (bkg, coeffs): the background at all rows of the image, and the
+# coefficients of all columns, shape (order+1, ncols). Columns with fewer
+# than order+1 usable pixels get NaN.
+def fitBackground(img, rows, order=2, err=None, mask=None):
+    rows   = numpy.asarray(rows)
+    nRows  = img.shape[0]
+    Y      = numpy.asarray(img[rows], dtype=numpy.float64)
+    nCols  = Y.shape[1]
+    centre    = 0.5*(rows.min() + rows.max())
+    halfWidth = max(0.5*(rows.max() - rows.min()), 1.0)
+    A = _vander(rows, order, centre, halfWidth)
+
+    if err is None and mask is None:
+        # Same weights for all columns: factorise the design matrix once.
+        Q, R = numpy.linalg.qr(A)
+        a = numpy.linalg.solve(R, numpy.dot(Q.T, Y))
+    else:
+        W = numpy.ones_like(Y)
+        if err is not None:
+            err = _backgroundRows(err, rows, nRows)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                W = numpy.where((err > 0) & numpy.isfinite(err), 1.0/err**2, 0.0)
+        if mask is not None:
+            W[_backgroundRows(mask, rows, nRows).astype(bool)] = 0.0
+        W[~numpy.isfinite(Y)] = 0.0
+        WY = numpy.where(W > 0, W*Y, 0.0)
+        # Normal equations of all columns: G[c,p,q] = sum_i W[i,c] t_i^(p+q)
+        # is a Hankel matrix of the weighted moments of t.
+        powers  = _vander(rows, 2*order, centre, halfWidth)
+        moments = numpy.dot(powers.T, W)                 # (2*order+1, nCols)
+        index   = numpy.add.outer(numpy.arange(order + 1), numpy.arange(order + 1))
+        G = numpy.moveaxis(moments[index], -1, 0)        # (nCols, order+1, order+1)
+        b = numpy.dot(A.T, WY).T                         # (nCols, order+1)
+        good = numpy.count_nonzero(W, axis=0) > order
+        a = numpy.full((order + 1, nCols), numpy.nan)
+        if numpy.any(good):
+            a[:,good] = numpy.linalg.solve(G[good], b[good][:,:,None])[:,:,0].T
+
+    bkg    = numpy.dot(_vander(numpy.arange(nRows), order, centre, halfWidth), a)
+    coeffs = numpy.dot(_unscale(order, centre, halfWidth), a)
+    dtype  = numpy.result_type(img.dtype, numpy.float32)
+    return bkg.astype(dtype), coeffs
+
+
+# The background rows of an array that is either image-sized or already
+# restricted to the background rows.
+def _backgroundRows(values, rows, nRows):
+    if values.shape[0] == nRows and len(rows) != nRows:
+        return numpy.asarray(values[rows])
+    return numpy.asarray(values)
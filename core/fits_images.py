@@ -0,0 +1,454 @@
+"""
+Lazy access to the images of FITS files, plain or gzipped.
+
+pyfits.open(...)[1].data reads a whole extension into memory. Here the
+headers are parsed when the file is opened, but the data are only mapped
+(numpy.memmap): indexing an image, e.g.
+
+   sci, err, dq = scienceArrays('3c120_stis.fits.gz')
+   band = sci[230:280, :]
+
+reads just the rows 230-279 of the SCI extension from disk. Gzipped files
+cannot be mapped directly. They are decompressed block by block into an
+uncompressed copy in a cache directory, only as far into the file as the
+data asked for so far. Closing the file (FitsFile in a with statement, or
+scienceArrays) completes the copy, which is then reused by later calls
+(and other processes). Every process decompresses into its own temporary
+file and renames it when complete, so a cached copy is never partial. Cached copies are named after the path, size and
+modification time of the original, so a changed file is decompressed again.
+"""
+import numpy,os,glob,gzip,zlib,hashlib,tempfile
+
+# FITS files consist of blocks of 2880 bytes, headers of 80-byte cards.
+FITS_BLOCK = 2880
+CARD = 80
+
+# Bytes of compressed data decompressed at a time.
+GZIP_BLOCK = 1024*1024
+
+# Default directory for the uncompressed copies of gzipped files.
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'fits_cache')
+
+_BITPIX = {8: 'u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}
+
+
+# Value of a header card: str, bool, int, float or None.
+def _parseValue(text):
+    text = text.strip()
+    if text.startswith("'"):
+        # Quotes inside strings are doubled.
+        end = 1
+        while True:
+            end = text.find("'", end)
+            if end < 0 or text[end:end+2] != "''":
+                break
+            end = end + 2
+        return text[1:end].replace("''", "'").rstrip()
+    text = text.split('/')[0].strip()
+    if text == 'T':
+        return True
+    if text == 'F':
+        return False
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text.replace('D', 'E'))
+    except ValueError:
+        return text
+
+
+class Header(object):
+
+    # cards ... list of 80-character header cards (without END).
+    def __init__(self, cards):
+        self.cards  = cards
+        self.values = {}
+        for card in cards:
+            if card[8:10] == '= ':
+                keyword = card[:8].strip()
+                if keyword not in self.values:
+                    self.values[keyword] = _parseValue(card[10:])
+
+    def __getitem__(self, keyword):
+        return self.values[keyword]
+
+    def __contains__(self, keyword):
+        return keyword in self.values
+
+    def get(self, keyword, default=None):
+        return self.values.get(keyword, default)
+
+    def __repr__(self):
+        return '\n'.join(card.rstrip() for card in self.cards)
+
+
+# An uncompressed file on disk.
+class _PlainSource(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def size(self):
+        return os.path.getsize(self.filename)
+
+    def read(self, offset, n):
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            return f.read(n)
+
+    # Read-only memory map of a range of the file as an array.
+    def array(self, offset, dtype, shape):
+        return numpy.memmap(self.filename, dtype=dtype, mode='r', offset=offset,
+                            shape=shape)
+
+
+# A file decompressed into memory.
+class _MemorySource(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    def size(self):
+        return len(self.data)
+
+    def read(self, offset, n):
+        return self.data[offset:offset+n]
+
+    def array(self, offset, dtype, shape):
+        count = int(numpy.prod(shape))
+        return numpy.frombuffer(self.data, dtype=dtype, count=count,
+                                offset=offset).reshape(shape)
+
+
+# A gzipped file, decompressed on demand into a cache file.
+class _GzipSource(object):
+
+    def __init__(self, filename, cacheDir=None, blockSize=GZIP_BLOCK):
+        if cacheDir is None:
+            cacheDir = CACHE_DIR
+        stat = os.stat(filename)
+        key  = '%s:%d:%d' % (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+        name = os.path.basename(filename)
+        if name.endswith('.gz'):
+            name = name[:-3]
+        self.filename  = filename
+        self.cacheName = os.path.join(cacheDir, '%s-%s' % (hashlib.sha1(key.encode()).hexdigest()[:16], name))
+        self.blockSize = blockSize
+        self.complete  = os.path.exists(self.cacheName)
+        self.length    = os.path.getsize(self.cacheName) if self.complete else 0
+        self.partName  = None
+        self._input    = None
+        if not self.complete:
+            _removeStaleParts(self.cacheName)
+
+    # Make sure that the first stop bytes are in the cache file.
+    def _decompress(self, stop):
+        if self.complete or self.length >= stop:
+            return
+        if self._input is None:
+            if not os.path.isdir(os.path.dirname(self.cacheName)):
+                os.makedirs(os.path.dirname(self.cacheName), exist_ok=True)
+            self.partName = self.cacheName + '.%d.part' % os.getpid()
+            self._input   = open(self.filename, 'rb')
+            self._output  = open(self.partName, 'wb')
+            self._gzip    = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while self.length < stop:
+            block = self._gzip.unconsumed_tail or self._input.read(self.blockSize)
+            if not block:
+                self._finish()
+                return
+            data = self._gzip.decompress(block, self.blockSize*8)
+            if self._gzip.eof:
+                # Files may consist of several gzip members.
+                rest = self._gzip.unused_data
+                self._gzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                if rest:
+                    data = data + self._gzip.decompress(rest, self.blockSize*8)
+            self._output.write(data)
+            self.length = self.length + len(data)
+        self._output.flush()
+
+    # The whole file is decompressed: move it into place for later use.
+    def _finish(self):
+        self._input.close()
+        self._output.close()
+        os.replace(self.partName, self.cacheName)
+        self.complete = True
+        self._input = None
+
+    def _name(self):
+        return self.cacheName if self.complete else self.partName
+
+    def size(self):
+        self._decompress(numpy.inf)
+        return self.length
+
+    def read(self, offset, n):
+        self._decompress(offset + n)
+        with open(self._name(), 'rb') as f:
+            f.seek(offset)
+            return f.read(n)
+
+    def array(self, offset, dtype, shape):
+        self._decompress(offset + numpy.dtype(dtype).itemsize*int(numpy.prod(shape)))
+        return numpy.memmap(self._name(), dtype=dtype, mode='r', offset=offset,
+                            shape=shape)
+
+    # Decompress the rest of the file, so that the cached copy is complete
+    # and can be used by later calls; on failure the partial copy is
+    # deleted.
+    def close(self):
+        if self._input is None:
+            return
+        try:
+            self._decompress(numpy.inf)
+        finally:
+            if self._input is not None:
+                self._input.close()
+                self._output.close()
+                os.remove(self.partName)
+                self._input = None
+                self.length = 0
+
+
+# Delete partial copies of cacheName left by processes that no longer exist
+# (e.g. killed while decompressing). Each process writes its own
+# cacheName.<pid>.part and renames it to cacheName when it is complete.
+def _removeStaleParts(cacheName):
+    for partName in glob.glob(glob.escape(cacheName) + '.*.part'):
+        try:
+            pid = int(partName[len(cacheName)+1:-len('.part')])
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            try:
+                os.remove(partName)
+            except OSError:
+                pass
+        except (ValueError, OSError):
+            pass
+
+
+class LazyImage(object):
+
+    # Image data of an HDU: nothing is read until the image is indexed.
+    # source ... _PlainSource or _GzipSource.
+    # offset ... byte offset of the data in the (uncompressed) file.
+    # bitpix, shape, bscale, bzero ... from the header; shape is
+    #            (NAXISn, ..., NAXIS1), i.e. rows first.
+    def __init__(self, source, offset, bitpix, shape, bscale=1.0, bzero=0.0):
+        self.source = source
+        self.offset = offset
+        self.raw    = numpy.dtype(_BITPIX[bitpix])
+        self.shape  = shape
+        self.bscale = bscale
+        self.bzero  = bzero
+        self.ndim   = len(shape)
+        # Unsigned integers are stored as signed ones with BZERO = 2**(bits-1).
+        self.unsigned = (bitpix in (16, 32, 64) and bscale == 1
+                         and bzero == 2**(bitpix - 1))
+        if self.unsigned:
+            self.dtype = numpy.dtype('u%d' % (bitpix//8))
+        elif bscale != 1 or bzero != 0:
+            self.dtype = numpy.dtype(numpy.float32 if abs(bitpix) <= 16 else numpy.float64)
+        else:
+            self.dtype = self.raw.newbyteorder('=')
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return 'LazyImage(shape=%s, dtype=%s)' % (self.shape, self.dtype)
+
+    @property
+    def nbytes(self):
+        return self.dtype.itemsize*int(numpy.prod(self.shape))
+
+    # Memory map of rows start..stop-1 as stored in the file (big-endian,
+    # unscaled).
+    def rows(self, start=0, stop=None):
+        if stop is None:
+            stop = self.shape[0]
+        rowBytes = self.raw.itemsize*int(numpy.prod(self.shape[1:]))
+        return self.source.array(self.offset + start*rowBytes, self.raw,
+                                 (stop - start,) + tuple(self.shape[1:]))
+
+    # Stored values to physical values, in native byte order.
+    def _scale(self, raw):
+        if self.unsigned:
+            signBit = numpy.array(1 << (8*self.raw.itemsize - 1)).astype(self.dtype)
+            return raw.view(self.raw.str.replace('i', 'u')).astype(self.dtype) ^ signBit
+        if self.bscale != 1 or self.bzero != 0:
+            return (raw*self.dtype.type(self.bscale) + self.dtype.type(self.bzero)).astype(self.dtype)
+        return raw.astype(self.dtype)
+
+    # img[key] maps only the rows selected by the first index and returns
+    # a normal (in-memory) array.
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        first, rest = key[0] if key else slice(None), key[1:]
+        if isinstance(first, (int, numpy.integer)):
+            if first < 0:
+                first = first + self.shape[0]
+            if not 0 <= first < self.shape[0]:
+                raise IndexError("row index out of range")
+            return self._scale(self.rows(first, first + 1)[(0,) + rest])
+        if isinstance(first, slice):
+            selected = range(*first.indices(self.shape[0]))
+            if len(selected) == 0:
+                return numpy.zeros((0,) + tuple(self.shape[1:]), self.dtype)[(slice(None),) + rest]
+            start, stop = min(selected), max(selected) + 1
+            local = slice(selected.start - start, None if selected.stop < start else selected.stop - start,
+                          selected.step)
+            return self._scale(self.rows(start, stop)[(local,) + rest])
+        # Anything else (fancy indexing, reversed slices): map all rows.
+        return self._scale(self.rows()[key])
+
+    # The whole image as an array.
+    def read(self):
+        return self._scale(self.rows())
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.read()
+        return data if dtype is None else data.astype(dtype)
+
+
+class HDU(object):
+
+    # header ... Header; data ... LazyImage, or None if there is no image.
+    def __init__(self, header, data):
+        self.header = header
+        self.data   = data
+
+    @property
+    def name(self):
+        return self.header.get('EXTNAME', 'PRIMARY' if 'SIMPLE' in self.header else '')
+
+    def __repr__(self):
+        return 'HDU(%s, %s)' % (self.name or '?', self.data)
+
+
+class FitsFile(object):
+
+    # filename ... FITS file, may be gzipped ('.gz', or recognised by its
+    #              first bytes).
+    # cacheDir ... directory for the uncompressed copies of gzipped files
+    #              (default CACHE_DIR); False decompresses them into memory
+    #              instead (for files that are read only once).
+    # Headers are read on demand, so opening a file reads nothing and
+    # fits['SCI'] reads (or decompresses) only up to the SCI header.
+    def __init__(self, filename, cacheDir=None):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            gzipped = f.read(2) == b'\x1f\x8b'
+        if gzipped and cacheDir is False:
+            with gzip.open(filename, 'rb') as f:
+                self.source = _MemorySource(f.read())
+        elif gzipped:
+            self.source = _GzipSource(filename, cacheDir)
+        else:
+            self.source = _PlainSource(filename)
+        self._hdus   = []
+        self._offset = 0
+        self._end    = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Finish decompressing a gzipped file into the cache (images already
+    # taken from the file stay valid). Use FitsFile in a with statement, or
+    # call close, so that no partial copies are left behind.
+    def close(self):
+        if isinstance(self.source, _GzipSource):
+            self.source.close()
+
+    # Read the next header; False at the end of the file.
+    def _readNext(self):
+        if self._end:
+            return False
+        cards  = []
+        offset = self._offset
+        while True:
+            block = self.source.read(offset, FITS_BLOCK)
+            if len(block) < FITS_BLOCK:
+                if cards:
+                    raise IOError("%s: truncated header" % self.filename)
+                self._end = True
+                return False
+            offset = offset + FITS_BLOCK
+            block  = block.decode('ascii', 'replace')
+            blockCards = [block[i:i+CARD] for i in range(0, FITS_BLOCK, CARD)]
+            ends = [i for i, card in enumerate(blockCards) if card[:8].rstrip() == 'END']
+            if ends:
+                cards.extend(blockCards[:ends[0]])
+                break
+            cards.extend(blockCards)
+        header = Header(cards)
+        bitpix = header['BITPIX']
+        shape  = tuple(header['NAXIS%d' % i] for i in range(header['NAXIS'], 0, -1))
+        nData  = (abs(bitpix)//8*header.get('GCOUNT', 1)
+                  *(header.get('PCOUNT', 0) + (int(numpy.prod(shape)) if shape else 0)))
+        image  = (shape and header.get('XTENSION', 'IMAGE') == 'IMAGE'
+                  and header.get('GROUPS') is not True)
+        data   = None
+        if image:
+            data = LazyImage(self.source, offset, bitpix, shape,
+                             header.get('BSCALE', 1.0), header.get('BZERO', 0.0))
+        self._hdus.append(HDU(header, data))
+        self._offset = offset + ((nData + FITS_BLOCK - 1)//FITS_BLOCK)*FITS_BLOCK
+        return True
+
+    def __len__(self):
+        while self._readNext():
+            pass
+        return len(self._hdus)
+
+    def __iter__(self):
+        i = 0
+        while i < len(self._hdus) or self._readNext():
+            yield self._hdus[i]
+            i = i + 1
+
+    # fits[1], fits['SCI'] or fits['SCI', 2] (EXTNAME and EXTVER).
+    def __getitem__(self, key):
+        if isinstance(key, (int, numpy.integer)):
+            while key >= len(self._hdus) and self._readNext():
+                pass
+            return self._hdus[key]
+        if isinstance(key, tuple):
+            name, version = key
+        else:
+            name, version = key, None
+        for hdu in self:
+            if (hdu.name.upper() == name.upper()
+                    and (version is None or hdu.header.get('EXTVER', 1) == version)):
+                return hdu
+        raise KeyError("%s has no extension %s" % (self.filename, key))
+
+    def __repr__(self):
+        return 'FitsFile(%r)' % self.filename
+
+
+# The SCI, ERR and DQ images of an HST file (e.g. STIS) as lazy arrays.
+# version ... EXTVER of the imset.
+# The file is closed before returning (a gzipped file is then completely
+# decompressed into the cache); the lazy arrays remain usable.
+def scienceArrays(filename, version=1, cacheDir=None):
+    with FitsFile(filename, cacheDir) as fits:
+        return tuple(fits[name, version].data for name in ('SCI', 'ERR', 'DQ'))
+
+
+# The primary image of each file, e.g. of the tiles m82_wise/w1..w4.fits.
+def primaryImages(filenames, cacheDir=None):
+    images = []
+    for filename in filenames:
+        with FitsFile(filename, cacheDir) as fits:
+            images.append(fits[0].data)
+    return images
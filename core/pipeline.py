@@ -0,0 +1,290 @@
+"""
+Spectral extraction of whole directories of STIS frames.
+
+The reduction of core.rst as a chain of stages, each a function that takes
+a frame (a dict holding the images and results so far) and returns it:
+
+   loadFrame         -> img, err, dq        (fits_images.py)
+   cleanFrame        -> img with cosmic rays removed (cosmic_rays.py)
+   subtractBackground-> img minus the fitted background (background.py)
+   extractSpectrum   -> spectrum, spectrumErr
+
+   pipeline = stisPipeline(outputDir='spectra', sourceRows=(230, 280))
+   results = pipeline.run('night1/')
+
+Frames are processed by a pool of processes. Only a bounded number of
+frames is queued at a time, so a night of data never has to fit in memory.
+Every worker reads its frames itself, so reading one frame overlaps with
+computing on the others. The spectrum of each frame is written to
+outputDir/<name>.npz together with the time spent in every stage, and
+timing.txt in outputDir lists the stage times of all frames. A frame that
+fails is recorded in failed.txt and does not stop the others. Gzipped
+frames are decompressed in memory, so nothing is left in temporary
+directories. An output is up to date if it was made from the same file
+content with the same stages and parameters (both enter a SHA-1 key stored
+in the output file). Such frames are skipped, so an interrupted run can
+simply be started again.
+"""
+import numpy,os,glob,time,hashlib,traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from fits_images import scienceArrays
+from cosmic_rays import CosmicRayFilter
+from background import fitBackground
+
+
+class Stage(object):
+
+    # func   ... module-level function func(frame, **params) -> frame (it
+    #            must be picklable to run in the worker processes).
+    # name   ... name for the timing (default: the function name).
+    # params ... keyword arguments of func; they are part of the cache key.
+    def __init__(self, func, name=None, **params):
+        self.func   = func
+        self.name   = name or func.__name__
+        self.params = params
+
+    def __call__(self, frame):
+        return self.func(frame, **self.params)
+
+    # Text identifying the stage and its parameters.
+    def key(self):
+        params = ', '.join('%s=%r' % (k, _plain(v)) for k, v in sorted(self.params.items()))
+        return '%s.%s(%s)' % (self.func.__module__, self.func.__name__, params)
+
+    def __repr__(self):
+        return 'Stage(%s)' % self.key()
+
+
+# Arrays in parameters are keyed by their values.
+def _plain(value):
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    return value
+
+
+# SHA-1 of the content of a file, read in blocks.
+def fileHash(filename, blockSize=1024*1024):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(blockSize)
+            if not block:
+                break
+            sha.update(block)
+    return sha.hexdigest()
+
+
+# ---- Stages of the STIS reduction -----------------------------------------
+
+# cacheDir ... False reads gzipped frames into memory, a directory keeps
+#              uncompressed copies there (see fits_images.FitsFile).
+def loadFrame(frame, version=1, cacheDir=False):
+    sci, err, dq = scienceArrays(frame['filename'], version, cacheDir)
+    frame['img'] = sci.read()
+    frame['err'] = err.read()
+    frame['dq']  = dq.read()
+    return frame
+
+# rows ... rows to clean (default: all but the source rows).
+def cleanFrame(frame, rows=None, size=5, threshold=8.0, maxIter=10):
+    if rows is None:
+        rows = ~_rowMask(frame['sourceRows'], frame['img'].shape[0])
+    crFilter = CosmicRayFilter(size, threshold, maxIter, workers=1)
+    frame['img'], frame['crMask'] = crFilter(frame['img'], frame['err'], rows=rows,
+                                             out=frame['img'])
+    return frame
+
+# rows     ... background rows (default as in core.rst).
+# weighted ... weight pixels by 1/err^2 and ignore pixels flagged in DQ.
+def subtractBackground(frame, rows=None, order=2, weighted=False):
+    if rows is None:
+        rows = numpy.append(numpy.arange(10, 200), numpy.arange(300, 480))
+    if weighted:
+        bkg, coeffs = fitBackground(frame['img'], rows, order, frame['err'], frame['dq'] != 0)
+    else:
+        bkg, coeffs = fitBackground(frame['img'], rows, order)
+    frame['img'] -= bkg
+    frame['bkgCoeffs'] = coeffs
+    return frame
+
+def extractSpectrum(frame):
+    start, stop = frame['sourceRows']
+    frame['spectrum']    = frame['img'][start:stop].sum(axis=0)
+    frame['spectrumErr'] = numpy.sqrt((frame['err'][start:stop].astype(numpy.float64)**2).sum(axis=0))
+    return frame
+
+
+def _rowMask(rows, nRows):
+    mask = numpy.zeros(nRows, dtype=bool)
+    mask[rows[0]:rows[1]] = True
+    return mask
+
+
+# ---- Running the stages over many files ------------------------------------
+
+# Process one file (in a worker process): returns a dict with filename,
+# output, status ('done', 'skipped' or 'failed'), times (list of (stage
+# name, seconds)) and, for failed frames, the error (a traceback).
+def _processFrame(stages, filename, outputName, configKey, sourceRows):
+    result = {'filename': filename, 'output': outputName, 'status': 'failed', 'times': []}
+    try:
+        return _runStages(stages, filename, outputName, configKey, sourceRows, result)
+    except Exception:
+        result['status'] = 'failed'
+        result['error']  = traceback.format_exc()
+        return result
+
+def _runStages(stages, filename, outputName, configKey, sourceRows, result):
+    start = time.perf_counter()
+    key = hashlib.sha1((fileHash(filename) + configKey).encode()).hexdigest()
+    result['key'] = key
+    now = time.perf_counter()
+    result['times'] = times = [('hash', now - start)]
+    if os.path.exists(outputName):
+        with numpy.load(outputName) as old:
+            if 'key' in old and str(old['key']) == key:
+                result['status'] = 'skipped'
+                return result
+    frame = {'filename': filename, 'sourceRows': sourceRows}
+    for stage in stages:
+        start = now
+        frame = stage(frame)
+        now = time.perf_counter()
+        times.append((stage.name, now - start))
+    # Write to a temporary file first, so that an interrupted run never
+    # leaves a half-written output that looks up to date.
+    temporary = outputName + '.%d.tmp.npz' % os.getpid()
+    numpy.savez(temporary, key=key, spectrum=frame.get('spectrum'),
+                spectrumErr=frame.get('spectrumErr'),
+                stages=[name for name, t in times], times=[t for name, t in times])
+    os.replace(temporary, outputName)
+    result['status'] = 'done'
+    return result
+
+
+# Result of a future of _processFrame; errors of the worker process itself
+# (e.g. a crash) are recorded as a failed frame.
+def _result(future, job):
+    try:
+        return future.result()
+    except Exception:
+        return {'filename': job[1], 'output': job[2], 'status': 'failed', 'times': [],
+                'error': traceback.format_exc()}
+
+
+class Pipeline(object):
+
+    # stages     ... list of Stage objects.
+    # outputDir  ... directory for the spectra and timing.txt.
+    # sourceRows ... (start, stop) rows of the source.
+    # workers    ... number of processes (1: run in this process).
+    # queueSize  ... maximum number of frames queued or in progress
+    #                (default 2*workers).
+    def __init__(self, stages, outputDir, sourceRows=(230, 280), workers=None,
+                 queueSize=None):
+        self.stages     = stages
+        self.outputDir  = outputDir
+        self.sourceRows = tuple(sourceRows)
+        self.workers    = workers or os.cpu_count() or 1
+        self.queueSize  = queueSize or 2*self.workers
+
+    # Key of the stages and their parameters, part of every output's key.
+    def configKey(self):
+        return '\n'.join([repr(self.sourceRows)] + [stage.key() for stage in self.stages])
+
+    def outputName(self, filename):
+        name = os.path.basename(filename)
+        for suffix in ('.gz', '.fits', '.fit'):
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        return os.path.join(self.outputDir, name + '.npz')
+
+    # Results as frames finish (not necessarily in the order of filenames).
+    # filenames ... list of files, or a directory (all *.fits and *.fits.gz
+    #               files in it).
+    def iterRun(self, filenames):
+        if isinstance(filenames, str):
+            filenames = sorted(glob.glob(os.path.join(filenames, '*.fits'))
+                               + glob.glob(os.path.join(filenames, '*.fits.gz')))
+        if not os.path.isdir(self.outputDir):
+            os.makedirs(self.outputDir)
+        configKey = self.configKey()
+        jobs = ((self.stages, filename, self.outputName(filename), configKey, self.sourceRows)
+                for filename in filenames)
+        if self.workers == 1:
+            for job in jobs:
+                yield _processFrame(*job)
+            return
+        with ProcessPoolExecutor(self.workers) as pool:
+            pending = {}
+            for job in jobs:
+                pending[pool.submit(_processFrame, *job)] = job
+                if len(pending) >= self.queueSize:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield _result(future, pending.pop(future))
+            for future in list(pending):
+                yield _result(future, pending.pop(future))
+
+    # Process all files and update timing.txt. Returns the list of results;
+    # failed frames are listed with their errors in failed.txt.
+    def run(self, filenames):
+        results = list(self.iterRun(filenames))
+        self.writeTiming(results, os.path.join(self.outputDir, 'timing.txt'))
+        failed = [result for result in results if result['status'] == 'failed']
+        failedName = os.path.join(self.outputDir, 'failed.txt')
+        if os.path.exists(failedName):
+            os.remove(failedName)
+        if failed:
+            with open(failedName, 'w') as f:
+                for result in failed:
+                    f.write('%s\n%s\n' % (result['filename'], result['error']))
+            print('%d of %d frames failed, see %s' % (len(failed), len(results), failedName))
+        return results
+
+    # Table of the time (seconds) per stage and frame. The table is merged
+    # with an existing one: frames skipped because they are up to date keep
+    # the times from when they were processed.
+    def writeTiming(self, results, filename):
+        names = ['hash'] + [stage.name for stage in self.stages]
+        header = '# file ' + ' '.join(names) + ' status\n'
+        rows = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                lines = f.readlines()
+            if lines and lines[0] == header:
+                for line in lines[1:]:
+                    if not line.startswith('#'):
+                        rows[line.split()[0]] = line
+        for result in results:
+            name = os.path.basename(result['filename'])
+            if result['status'] == 'skipped' and name in rows:
+                continue
+            times = dict(result['times'])
+            rows[name] = '%s %s %s\n' % (name, ' '.join('%.4f' % times.get(n, 0.0) for n in names),
+                                         result['status'])
+        totals = numpy.zeros(len(names))
+        for line in rows.values():
+            totals += numpy.array(line.split()[1:-1], dtype=float)
+        temporary = filename + '.%d.tmp' % os.getpid()
+        with open(temporary, 'w') as f:
+            f.write(header)
+            for name in sorted(rows):
+                f.write(rows[name])
+            f.write('# total %s\n' % ' '.join('%.4f' % t for t in totals))
+        os.replace(temporary, filename)
+
+
+# The reduction of core.rst as a Pipeline.
+# weighted ... weight the background fit by the errors, ignoring DQ pixels.
+# cacheDir ... see loadFrame.
+def stisPipeline(outputDir, sourceRows=(230, 280), backgroundRows=None, order=2,
+                 threshold=8.0, weighted=False, workers=None, queueSize=None,
+                 cacheDir=False):
+    stages = [Stage(loadFrame, 'load', cacheDir=cacheDir),
+              Stage(cleanFrame, 'cosmics', threshold=threshold),
+              Stage(subtractBackground, 'background', rows=backgroundRows, order=order,
+                    weighted=weighted),
+              Stage(extractSpectrum, 'extract')]
+    return Pipeline(stages, outputDir, sourceRows, workers, queueSize)
@@ -0,0 +1,144 @@
+"""
+Linear least-squares fits of many datasets that share one design matrix.
+
+The typical case is the same linear model (e.g. a polynomial continuum)
+fitted to millions of spectra or light curves sampled on the same grid.
+Instead of calling leastsq once per dataset, batchLinearFit solves all of
+them at once:
+
+* If all datasets share the same errors and no points are masked, the
+  weighted design matrix is factorised once (QR) and all datasets are solved
+  with a single matrix product.
+* With per-dataset errors or masks, the normal matrices of all datasets are
+  built with one matrix product and solved by a batched Cholesky
+  factorisation.
+"""
+import numpy
+
+
+# Design matrix of a polynomial of given order, columns 1, x, x^2, ...
+def polynomialDesign(x, order):
+    return numpy.vander(numpy.asarray(x, dtype=numpy.float64), order + 1,
+                        increasing=True)
+
+
+class BatchFitResult(object):
+
+    # params     ... (n_datasets, n_params) best-fit parameters.
+    # covariance ... (n_datasets, n_params, n_params) covariance matrices.
+    # chi2       ... (n_datasets,) chi-square of every fit.
+    # dof        ... (n_datasets,) degrees of freedom of every fit. Fits with
+    #                dof < 0 have too few points and NaN parameters.
+    def __init__(self, params, covariance, chi2, dof):
+        self.params     = params
+        self.covariance = covariance
+        self.chi2       = chi2
+        self.dof        = dof
+
+    @property
+    def errors(self):
+        return numpy.sqrt(numpy.diagonal(self.covariance, axis1=-2, axis2=-1))
+
+    # chi2/dof, NaN for fits without degrees of freedom (dof <= 0).
+    @property
+    def reducedChi2(self):
+        dof = numpy.where(self.dof > 0, self.dof, 1)
+        return numpy.where(self.dof > 0, self.chi2/dof, numpy.nan)
+
+
+# All datasets have the same weights: one QR factorisation for all of them.
+def _fitShared(A, Y, weight):
+    Aw = A*weight[:,None]
+    Q, R = numpy.linalg.qr(Aw)
+    Yw = Y*weight[None,:]
+    # params^T = R^-1 Q^T Yw^T, for all datasets in one go.
+    params = numpy.linalg.solve(R, numpy.dot(Q.T, Yw.T)).T
+    Rinv   = numpy.linalg.inv(R)
+    cov    = numpy.dot(Rinv, Rinv.T)
+    resid  = Yw - numpy.dot(params, Aw.T)
+    chi2   = numpy.einsum('ij,ij->i', resid, resid)
+    return params, cov, chi2
+
+
+# Every dataset has its own weights W = mask/sigma^2: batched normal equations.
+def _fitIndividual(A, Y, W):
+    n_points, p = A.shape
+    # Scale the columns of A to unit norm to keep the normal matrices well
+    # conditioned; the parameters are scaled back at the end.
+    scale = numpy.sqrt(numpy.sum(A*A, axis=0))
+    scale[scale == 0.0] = 1.0
+    As = A/scale
+    # Normal matrices for all datasets with a single matrix product:
+    # N_k = sum_n W_kn a_n a_n^T.
+    outer = (As[:,:,None]*As[:,None,:]).reshape(n_points, p*p)
+    N = numpy.dot(W, outer).reshape(-1, p, p)
+    b = numpy.dot(W*Y, As)
+    params = numpy.full(b.shape, numpy.nan)
+    cov    = numpy.full(N.shape, numpy.nan)
+    # Datasets with too few points have singular normal matrices.
+    good = numpy.sum(W > 0.0, axis=1) >= p
+    if numpy.any(good):
+        try:
+            L = numpy.linalg.cholesky(N[good])
+        except numpy.linalg.LinAlgError:
+            L = None
+        if L is not None:
+            Linv = numpy.linalg.inv(L)
+            Ninv = numpy.matmul(numpy.swapaxes(Linv, 1, 2), Linv)
+        else:
+            # Fall back to a pseudo-inverse if some normal matrix is singular.
+            Ninv = numpy.linalg.pinv(N[good])
+        cov[good]    = Ninv
+        params[good] = numpy.einsum('kij,kj->ki', Ninv, b[good])
+    params = params/scale
+    cov    = cov/numpy.outer(scale, scale)
+    resid  = Y - numpy.dot(params, A.T)
+    chi2   = numpy.einsum('ij,ij->i', W*resid, resid)
+    return params, cov, chi2
+
+
+# Fit the linear model Y_k = A p_k to every dataset k.
+# design    ... (n_points, n_params) design matrix, shared by all datasets.
+# Y         ... (n_datasets, n_points) observed data.
+# sigma     ... errors, either None (unit errors), (n_points,) shared by all
+#               datasets, or (n_datasets, n_points).
+# mask      ... optional (n_datasets, n_points) boolean array, True for points
+#               that are used in the fit.
+# chunkSize ... number of datasets processed at a time (bounds memory).
+# Returns a BatchFitResult.
+def batchLinearFit(design, Y, sigma=None, mask=None, chunkSize=65536):
+    A = numpy.asarray(design, dtype=numpy.float64)
+    Y = numpy.atleast_2d(numpy.asarray(Y, dtype=numpy.float64))
+    n_datasets, n_points = Y.shape
+    p = A.shape[1]
+    if A.shape[0] != n_points:
+        raise ValueError("design matrix and data have different number of points")
+    if sigma is None:
+        sigma = numpy.ones(n_points)
+    sigma = numpy.asarray(sigma, dtype=numpy.float64)
+    shared = sigma.ndim == 1 and mask is None
+
+    if shared:
+        if n_points < p:
+            raise ValueError("%d points are too few to fit %d parameters" % (n_points, p))
+        params, cov, chi2 = _fitShared(A, Y, 1.0/sigma)
+        covariance = numpy.broadcast_to(cov, (n_datasets, p, p))
+        dof = numpy.full(n_datasets, n_points - p)
+        return BatchFitResult(params, covariance, chi2, dof)
+
+    params     = numpy.empty((n_datasets, p))
+    covariance = numpy.empty((n_datasets, p, p))
+    chi2       = numpy.empty(n_datasets)
+    dof        = numpy.empty(n_datasets, dtype=numpy.int64)
+    for start in range(0, n_datasets, chunkSize):
+        stop = min(start + chunkSize, n_datasets)
+        s = sigma if sigma.ndim == 1 else sigma[start:stop]
+        W = numpy.broadcast_to(1.0/(s*s), (stop - start, n_points))
+        if mask is not None:
+            m = numpy.asarray(mask[start:stop], dtype=bool)
+            W = numpy.where(m, W, 0.0)
+        # Masked points may hold NaNs; they must not leak into the sums.
+        y = numpy.where(W > 0.0, Y[start:stop], 0.0)
+        params[start:stop], covariance[start:stop], chi2[start:stop] = _fitIndividual(A, y, W)
+        dof[start:stop] = numpy.sum(W > 0.0, axis=1) - p
+    return BatchFitResult(params, covariance, chi2, dof)
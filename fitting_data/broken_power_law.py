@@ -0,0 +1,201 @@
+"""
+Likelihood of a broken (multi-segment) power-law mass function, such as the
+Kroupa IMF.
+
+The mass function dN/dM = A_k M^-alpha_k on segment k, i.e. between the
+break masses b_k and b_k+1 (b_0 = M_min, b_K = M_max), is continuous at the
+breaks. As for the single power law, the data only enter the log-likelihood
+through per-segment sufficient statistics: the number of stars n_k and the
+sum of their log-masses D_k.
+
+* With fixed break masses the catalogue is binned once; afterwards every
+  evaluation costs O(K), independent of the number of stars.
+* With free break masses the sorted log-masses and their prefix sums are
+  kept, so n_k and D_k for any breaks follow from a binary search, i.e.
+  O(K log N) per evaluation.
+
+All functions are vectorised over many parameter vectors (e.g. the chains of
+an ensemble sampler).
+"""
+import numpy,math
+
+from salpeter_likelihood import _logRelExpm1
+from salpeter_sampling import getGenerator, sampleFromSalpeter
+
+
+# Concatenate masses given as one array or an iterable of chunks.
+def _collectMasses(Masses):
+    if isinstance(Masses, numpy.ndarray):
+        return numpy.asarray(Masses, dtype=numpy.float64).ravel()
+    return numpy.concatenate([numpy.asarray(chunk, dtype=numpy.float64).ravel()
+                              for chunk in Masses])
+
+
+class SortedMassIndex(object):
+
+    # Sorted log-masses and their prefix sums.
+    # Masses ... array of masses or iterable of chunks.
+    def __init__(self, Masses):
+        self.logMasses = numpy.sort(numpy.log(_collectMasses(Masses)))
+        # cumLog[i] = sum of the i smallest log-masses.
+        self.cumLog = numpy.concatenate([[0.0], numpy.cumsum(self.logMasses)])
+
+    def __len__(self):
+        return len(self.logMasses)
+
+    # Counts and log-mass sums between consecutive edges.
+    # logEdges ... array (..., K+1) of increasing log-masses; the outer edges
+    #              must enclose all masses. A mass equal to an inner edge
+    #              belongs to the upper segment.
+    # Returns n, D, both of shape (..., K).
+    def statistics(self, logEdges):
+        logEdges = numpy.asarray(logEdges, dtype=numpy.float64)
+        index = numpy.searchsorted(self.logMasses, logEdges, side='left')
+        index[...,0]  = 0
+        index[...,-1] = len(self.logMasses)
+        n = numpy.diff(index, axis=-1).astype(numpy.float64)
+        D = numpy.diff(self.cumLog[index], axis=-1)
+        return n, D
+
+
+class BrokenPowerLawLikelihood(object):
+
+    # M_min, M_max ... mass interval.
+    # nSegments    ... number of power-law segments K.
+    # breaks       ... fixed break masses (K-1,), or None if they are free.
+    # n, D         ... per-segment counts and log-mass sums (fixed breaks).
+    # index        ... SortedMassIndex (free breaks).
+    # Use fromMasses or withFreeBreaks to build one from a catalogue.
+    def __init__(self, M_min, M_max, nSegments, breaks=None, n=None, D=None,
+                 index=None):
+        if not (0.0 < M_min < M_max):
+            raise ValueError("require 0 < M_min < M_max")
+        self.M_min     = float(M_min)
+        self.M_max     = float(M_max)
+        self.nSegments = nSegments
+        self.breaks    = None if breaks is None else numpy.asarray(breaks, dtype=numpy.float64)
+        self.n         = None if n is None else numpy.asarray(n, dtype=numpy.float64)
+        self.D         = None if D is None else numpy.asarray(D, dtype=numpy.float64)
+        self.index     = index
+
+    # Bin a catalogue once for fixed break masses. Masses may be an array
+    # or an iterable of chunks, which are binned one at a time.
+    @classmethod
+    def fromMasses(cls, Masses, M_min, M_max, breaks):
+        breaks = numpy.asarray(breaks, dtype=numpy.float64)
+        if numpy.any(numpy.diff(breaks) <= 0.0) or breaks[0] <= M_min or breaks[-1] >= M_max:
+            raise ValueError("breaks must increase strictly inside (M_min, M_max)")
+        K = len(breaks) + 1
+        n = numpy.zeros(K)
+        D = numpy.zeros(K)
+        if isinstance(Masses, numpy.ndarray):
+            Masses = [Masses]
+        for chunk in Masses:
+            chunk = numpy.asarray(chunk, dtype=numpy.float64).ravel()
+            if chunk.size == 0:
+                continue
+            if chunk.min() < M_min or chunk.max() > M_max:
+                raise ValueError("masses outside of [M_min, M_max]")
+            segment = numpy.searchsorted(breaks, chunk, side='right')
+            n += numpy.bincount(segment, minlength=K)
+            D += numpy.bincount(segment, weights=numpy.log(chunk), minlength=K)
+        return cls(M_min, M_max, K, breaks=breaks, n=n, D=D)
+
+    # Index a catalogue for a likelihood with free break masses.
+    @classmethod
+    def withFreeBreaks(cls, Masses, M_min, M_max, nSegments):
+        index = SortedMassIndex(Masses)
+        if len(index) > 0 and (index.logMasses[0] < math.log(M_min)
+                               or index.logMasses[-1] > math.log(M_max)):
+            raise ValueError("masses outside of [M_min, M_max]")
+        return cls(M_min, M_max, nSegments, index=index)
+
+    @property
+    def freeBreaks(self):
+        return self.index is not None
+
+    @property
+    def nParams(self):
+        return 2*self.nSegments - 1 if self.freeBreaks else self.nSegments
+
+    # Log-edges (..., K+1) of the segments.
+    def _logEdges(self, breaks, shape):
+        logBreaks = numpy.log(numpy.broadcast_to(breaks, shape + (self.nSegments - 1,)))
+        lower = numpy.full(shape + (1,), math.log(self.M_min))
+        upper = numpy.full(shape + (1,), math.log(self.M_max))
+        return numpy.concatenate([lower, logBreaks, upper], axis=-1)
+
+    # Log-likelihood for arrays of parameters.
+    # alpha  ... (..., K) slopes of the segments.
+    # breaks ... (..., K-1) break masses; ignored if the breaks are fixed.
+    # Unordered breaks or breaks outside (M_min, M_max) give -inf.
+    def logLikelihood(self, alpha, breaks=None):
+        alpha = numpy.asarray(alpha, dtype=numpy.float64)
+        shape = alpha.shape[:-1]
+        if self.freeBreaks:
+            if breaks is None:
+                raise ValueError("break masses are free parameters")
+            breaks = numpy.asarray(breaks, dtype=numpy.float64)
+            shape  = numpy.broadcast(alpha[...,0], breaks[...,0]).shape
+            alpha  = numpy.broadcast_to(alpha, shape + (self.nSegments,))
+        else:
+            breaks = self.breaks
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            logEdges = self._logEdges(breaks, shape)
+        width = numpy.diff(logEdges, axis=-1)
+        valid = numpy.all(width > 0.0, axis=-1)
+        # Keep invalid parameters finite below; they are set to -inf at the end.
+        logEdges = numpy.where(valid[...,None], logEdges,
+                               numpy.linspace(math.log(self.M_min), math.log(self.M_max),
+                                              self.nSegments + 1))
+        width = numpy.diff(logEdges, axis=-1)
+        if self.freeBreaks:
+            n, D = self.index.statistics(logEdges)
+        else:
+            n, D = self.n, self.D
+        # Continuity at the breaks: log A_k = sum_{j<k} (alpha_j+1 - alpha_j) log b_j+1.
+        logA = numpy.zeros(alpha.shape)
+        logA[...,1:] = numpy.cumsum(numpy.diff(alpha, axis=-1)*logEdges[...,1:-1], axis=-1)
+        # Log of the integral of M^-alpha_k over segment k.
+        beta     = 1.0 - alpha
+        logInteg = (beta*logEdges[...,:-1] + numpy.log(width)
+                    + _logRelExpm1(beta*width))
+        terms = logA + logInteg
+        top   = numpy.max(terms, axis=-1)
+        logZ  = top + numpy.log(numpy.sum(numpy.exp(terms - top[...,None]), axis=-1))
+        N = numpy.sum(n, axis=-1)
+        logL = numpy.sum(n*logA - alpha*D, axis=-1) - N*logZ
+        return numpy.where(valid, logL, -numpy.inf)
+
+    # Log-likelihood of parameter vectors (..., nParams) = slopes followed by
+    # (if free) break masses, e.g. as logProbability for MetropolisHastings.
+    def logProbability(self, params):
+        params = numpy.asarray(params, dtype=numpy.float64)
+        K = self.nSegments
+        if self.freeBreaks:
+            return self.logLikelihood(params[...,:K], params[...,K:])
+        return self.logLikelihood(params[...,:K])
+
+
+# Draw N masses from a broken power law by sampling the number of stars per
+# segment and then every segment with sampleFromSalpeter.
+# alpha  ... K slopes; breaks ... K-1 break masses.
+def sampleFromBrokenPowerLaw(N, alpha, breaks, M_min, M_max, rng=None):
+    rng    = getGenerator(rng)
+    alpha  = numpy.asarray(alpha, dtype=numpy.float64)
+    edges  = numpy.concatenate([[M_min], breaks, [M_max]])
+    logEdges = numpy.log(edges)
+    width  = numpy.diff(logEdges)
+    logA   = numpy.concatenate([[0.0], numpy.cumsum(numpy.diff(alpha)*logEdges[1:-1])])
+    beta   = 1.0 - alpha
+    terms  = logA + beta*logEdges[:-1] + numpy.log(width) + _logRelExpm1(beta*width)
+    weights = numpy.exp(terms - numpy.max(terms))
+    counts  = rng.multinomial(N, weights/numpy.sum(weights))
+    Masses  = numpy.empty(N)
+    start   = 0
+    for k in range(len(alpha)):
+        sampleFromSalpeter(counts[k], alpha[k], edges[k], edges[k+1], rng=rng,
+                           out=Masses[start:start+counts[k]])
+        start = start + counts[k]
+    rng.shuffle(Masses)
+    return Masses
@@ -0,0 +1,253 @@
+"""
+Post-processing and convergence diagnostics of MCMC chains.
+
+Chains are arrays of shape (n_steps, K, n_params) as produced by the
+samplers in metropolis.py and hamiltonian.py. There are two ways of use:
+
+* Functions acting on a whole chain (which may be a memory-mapped file):
+  cleanChain, autocorrelation, integratedAutocorrTime, effectiveSampleSize
+  and splitRhat. They work on one parameter at a time, so only a single
+  (n_steps, K) slice is in memory at once.
+* ChainMonitor, which is updated with blocks of a chain while the sampler is
+  still running and keeps only O(K*n_params) numbers per batch. Combined
+  with sampleInBlocks, a run can stop as soon as an ESS target is reached.
+"""
+import numpy,math
+
+
+# Discard burn-in and thin out the rest. This only slices, so no copy of
+# the chain is made (also not for memory-mapped chains).
+# chain ... array of shape (n_steps, K, n_params).
+# burn  ... number of initial steps to discard.
+# thin  ... keep only every thin-th step.
+def cleanChain(chain, burn=None, thin=1):
+    if burn is None:
+        burn = len(chain)//2
+    return chain[burn::thin]
+
+
+# Normalised autocorrelation function along axis 0, computed via FFT.
+# x ... array of shape (n_steps, ...).
+def autocorrelation(x):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    n = x.shape[0]
+    # Zero-pad to a power of two >= 2n to avoid circular correlation.
+    size = 1 << int(math.ceil(math.log(2*n, 2)))
+    x = x - numpy.mean(x, axis=0)
+    f = numpy.fft.rfft(x, n=size, axis=0)
+    acf = numpy.fft.irfft(f*numpy.conjugate(f), n=size, axis=0)[:n]
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        acf = acf/acf[0]
+    return acf
+
+
+# Integrated autocorrelation time with Sokal's automatic window, i.e. the
+# smallest M with M >= c*tau(M). The autocorrelation function is averaged
+# over the K chains before summing (as in emcee).
+# chain ... array of shape (n_steps, K, n_params).
+# Returns an array with one autocorrelation time per parameter.
+def integratedAutocorrTime(chain, c=5.0):
+    n_steps, K, n_params = chain.shape
+    tau = numpy.empty(n_params)
+    for i in range(n_params):
+        acf  = numpy.mean(autocorrelation(chain[:,:,i]), axis=1)
+        taus = 2.0*numpy.cumsum(acf) - 1.0
+        window = numpy.arange(len(taus)) < c*taus
+        m = numpy.argmin(window) if not numpy.all(window) else len(taus) - 1
+        tau[i] = taus[m]
+    return tau
+
+
+# Effective sample size of the whole chain (all K chains), per parameter.
+# tau is floored at 1, so the ESS never exceeds the number of draws (also
+# not for anticorrelated chains).
+def effectiveSampleSize(chain, c=5.0):
+    n_steps, K, n_params = chain.shape
+    return n_steps*K/numpy.maximum(integratedAutocorrTime(chain, c), 1.0)
+
+
+# Split-R-hat of Gelman et al. (BDA3): every chain is split in two halves
+# and the within-chain variance is compared to the between-chain variance.
+# Values close to 1 (e.g. < 1.01) indicate convergence.
+def splitRhat(chain):
+    n_steps, K, n_params = chain.shape
+    half = n_steps//2
+    rhat = numpy.empty(n_params)
+    for i in range(n_params):
+        x = chain[:,:,i]
+        halves = numpy.concatenate([x[:half], x[n_steps-half:]], axis=1)
+        rhat[i] = _rhatFromMoments(half, numpy.mean(halves, axis=0),
+                                   numpy.var(halves, axis=0, ddof=1))
+    return rhat
+
+
+# R-hat from per-(split-)chain means and variances of n samples each.
+def _rhatFromMoments(n, means, variances):
+    W = numpy.mean(variances, axis=-1)
+    B = n*numpy.var(means, axis=-1, ddof=1)
+    varPlus = (n - 1.0)/n*W + B/n
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.sqrt(varPlus/W)
+
+
+# Merge count, mean and sum of squared deviations of two sets of samples
+# (Chan et al. 1979). Works element-wise on arrays.
+def _mergeMoments(n_a, mean_a, M2_a, n_b, mean_b, M2_b):
+    n     = n_a + n_b
+    delta = mean_b - mean_a
+    mean  = mean_a + delta*(float(n_b)/n)
+    M2    = M2_a + M2_b + delta*delta*(float(n_a)*n_b/n)
+    return n, mean, M2
+
+
+class ChainMonitor(object):
+
+    # burn       ... number of initial steps that are ignored.
+    # thin       ... only every thin-th step after burn-in is used.
+    # maxBatches ... the monitor keeps per-chain moments of between
+    #                maxBatches/2 and maxBatches batches; when there are too
+    #                many, neighbouring batches are merged.
+    def __init__(self, burn=0, thin=1, maxBatches=128):
+        self.burn       = burn
+        self.thin       = thin
+        self.maxBatches = maxBatches
+        self.batchSize  = 1
+        self.seen       = 0       # steps fed into the monitor so far
+        self.batches    = []      # list of (mean, M2), each of shape (K, n_params)
+        self.partial    = None    # incomplete batch as (count, mean, M2)
+
+    # Number of samples per chain entering the statistics.
+    @property
+    def count(self):
+        n = len(self.batches)*self.batchSize
+        if self.partial is not None:
+            n = n + self.partial[0]
+        return n
+
+    # Feed the next block of the chain, shape (n, K, n_params). The block may
+    # be a memory-mapped array; it is read once and not kept.
+    def update(self, block):
+        n = len(block)
+        # Indices (within the block) of steps that survive burn-in and thinning.
+        first  = max(self.burn - self.seen, 0)
+        offset = (self.seen + first - self.burn) % self.thin
+        if offset:
+            first = first + self.thin - offset
+        self.seen = self.seen + n
+        if first >= n:
+            return
+        block = numpy.asarray(block[first::self.thin], dtype=numpy.float64)
+        start = 0
+        while start < len(block):
+            if self.partial is None:
+                self.partial = (0, 0.0, 0.0)
+            count, mean, M2 = self.partial
+            take = min(self.batchSize - count, len(block) - start)
+            part = block[start:start+take]
+            self.partial = _mergeMoments(count, mean, M2, take,
+                                         numpy.mean(part, axis=0),
+                                         numpy.sum((part - numpy.mean(part, axis=0))**2, axis=0))
+            start = start + take
+            if self.partial[0] == self.batchSize:
+                self.batches.append(self.partial[1:])
+                self.partial = None
+                if len(self.batches) >= self.maxBatches:
+                    self._coarsen()
+
+    # Merge neighbouring batches, doubling the batch size.
+    def _coarsen(self):
+        merged = []
+        for j in range(0, len(self.batches) - 1, 2):
+            (m_a, M2_a), (m_b, M2_b) = self.batches[j], self.batches[j+1]
+            merged.append(_mergeMoments(self.batchSize, m_a, M2_a,
+                                        self.batchSize, m_b, M2_b)[1:])
+        if len(self.batches) % 2 == 1:
+            # A leftover batch becomes the start of the next (larger) batch.
+            m, M2 = self.batches[-1]
+            leftover = (self.batchSize, m, M2)
+            if self.partial is not None:
+                leftover = _mergeMoments(*(leftover + self.partial))
+            self.partial = leftover
+        self.batches   = merged
+        self.batchSize = 2*self.batchSize
+
+    # Per-chain count, mean and M2 of all completed batches.
+    def _chainMoments(self, batches):
+        n, mean, M2 = 0, 0.0, 0.0
+        for m, b in batches:
+            n, mean, M2 = _mergeMoments(n, mean, M2, self.batchSize, m, b)
+        return n, mean, M2
+
+    # As _chainMoments, but including the incomplete batch.
+    def _allMoments(self):
+        moments = self._chainMoments(self.batches)
+        if self.partial is not None:
+            moments = _mergeMoments(*(moments + self.partial))
+        return moments
+
+    # Posterior mean per parameter, pooling all chains.
+    @property
+    def mean(self):
+        n, mean, M2 = self._allMoments()
+        return numpy.mean(mean, axis=0)
+
+    # Posterior variance per parameter, pooling all chains.
+    @property
+    def variance(self):
+        n, mean, M2 = self._allMoments()
+        K = mean.shape[0]
+        total = numpy.sum(M2, axis=0) + n*numpy.sum((mean - numpy.mean(mean, axis=0))**2, axis=0)
+        return total/(n*K - 1.0)
+
+    # Split-R-hat per parameter, splitting at the batch in the middle.
+    def splitRhat(self):
+        half = len(self.batches)//2
+        if half < 1:
+            return numpy.nan
+        n1, mean1, M2_1 = self._chainMoments(self.batches[:half])
+        n2, mean2, M2_2 = self._chainMoments(self.batches[len(self.batches)-half:])
+        means = numpy.concatenate([mean1, mean2], axis=0).T
+        variances = numpy.concatenate([M2_1, M2_2], axis=0).T/(n1 - 1.0)
+        return _rhatFromMoments(n1, means, variances)
+
+    # Effective sample size per parameter from the batch-means estimate of the
+    # autocorrelation time, tau = batchSize*var(batch means)/var(samples).
+    # tau is floored at 1, so the ESS is at most the number of draws n*K and
+    # converged() cannot fire with fewer draws than essTarget.
+    def effectiveSampleSize(self):
+        nb = len(self.batches)
+        if nb < 2:
+            return numpy.zeros(1)
+        means = numpy.array([m for m, b in self.batches])   # (nb, K, n_params)
+        n, mean, M2 = self._chainMoments(self.batches)
+        varBatch  = numpy.var(means, axis=0, ddof=1)
+        varWithin = M2/(n - 1.0)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            tau = numpy.mean(self.batchSize*varBatch, axis=0)/numpy.mean(varWithin, axis=0)
+        tau = numpy.maximum(tau, 1.0)
+        K = means.shape[1]
+        return n*K/tau
+
+    # True if the ESS of all parameters exceeds essTarget and R-hat is
+    # below rhatMax.
+    def converged(self, essTarget, rhatMax=1.01):
+        if len(self.batches) < 8:
+            return False
+        return bool(numpy.all(self.effectiveSampleSize() >= essTarget)
+                    and numpy.all(self.splitRhat() < rhatMax))
+
+
+# Run a sampler (anything with a run(n_steps) method returning a chain
+# block) in blocks of blockSize steps until the monitor reports convergence
+# or maxSteps steps have been done. Every block is yielded, so the caller
+# can store it, e.g. by appending it to a file.
+def sampleInBlocks(sampler, monitor, essTarget, blockSize=1000,
+                   maxSteps=1000000, rhatMax=1.01):
+    done = 0
+    while done < maxSteps:
+        block = sampler.run(min(blockSize, maxSteps - done))
+        monitor.update(block)
+        done = done + len(block)
+        yield block
+        if monitor.converged(essTarget, rhatMax):
+            break
@@ -0,0 +1,164 @@
+"""
+Checkpointing of MCMC runs that may be interrupted.
+
+A long run is split into blocks. After every block
+
+* the block of the chain is appended to a ChainStore, a directory of
+  numbered .npy files that are never modified once written, and
+* the sampler state (position, cached log-probabilities, adaptation such
+  as step sizes, mass matrix or temperatures, acceptance counters and the
+  state of the random number generator) is written to a checkpoint file.
+
+Both are written to a temporary file first and then renamed, so an
+interruption at any moment leaves a consistent run behind. runWithCheckpoints
+continues from the last checkpoint and produces exactly the chain an
+uninterrupted run would have produced. The blocks can be memory-mapped for
+analysis while the run continues.
+
+The samplers list their state in the class attribute stateAttributes.
+Warm-up is not checkpointed: the adaptation state of warmup() is local to
+that call, and saveCheckpoint refuses a sampler that is warming up (or
+whose warm-up was interrupted). Warm up before runWithCheckpoints, and skip
+the warm-up when resuming, since the checkpoint holds the tuned sampler:
+
+   if not os.path.exists(os.path.join('run-1', 'checkpoint.pkl')):
+       sampler.warmup(2000)
+   store = runWithCheckpoints(sampler, 100000, 'run-1')
+"""
+import numpy,os,pickle
+
+
+# Write a file atomically: write(temporaryName) and rename afterwards.
+def _atomicWrite(filename, write):
+    temporary = filename + '.%d.tmp' % os.getpid()
+    write(temporary)
+    os.replace(temporary, filename)
+
+
+class ChainStore(object):
+
+    # directory ... directory holding the blocks chain-000000.npy, ...;
+    #               created if necessary.
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _blockName(self, i):
+        return os.path.join(self.directory, 'chain-%06d.npy' % i)
+
+    @property
+    def nBlocks(self):
+        n = 0
+        while os.path.exists(self._blockName(n)):
+            n = n + 1
+        return n
+
+    # Total number of steps in all blocks.
+    @property
+    def nSteps(self):
+        return sum(len(block) for block in self.blocks())
+
+    # Append a block of the chain, e.g. (n_steps, K, n_params).
+    def append(self, block):
+        block = numpy.asarray(block)
+        filename = self._blockName(self.nBlocks)
+        def write(temporary):
+            with open(temporary, 'wb') as f:
+                numpy.lib.format.write_array(f, block)
+        _atomicWrite(filename, write)
+
+    # Remove all blocks from number nBlocks onwards (used when resuming from
+    # a checkpoint that was written before these blocks).
+    def truncate(self, nBlocks):
+        n = self.nBlocks
+        for i in range(n - 1, nBlocks - 1, -1):
+            os.remove(self._blockName(i))
+
+    # List of the blocks, memory-mapped read-only unless mmap=False.
+    def blocks(self, mmap=True):
+        mode = 'r' if mmap else None
+        return [numpy.load(self._blockName(i), mmap_mode=mode)
+                for i in range(self.nBlocks)]
+
+    # Steps start..stop-1 of the chain as a single array.
+    def load(self, start=0, stop=None):
+        pieces = []
+        offset = 0
+        for block in self.blocks():
+            end = offset + len(block)
+            lo  = max(start - offset, 0)
+            hi  = len(block) if stop is None else min(stop - offset, len(block))
+            if hi > lo:
+                pieces.append(numpy.array(block[lo:hi]))
+            offset = end
+        if not pieces:
+            return numpy.empty((0,))
+        return numpy.concatenate(pieces)
+
+
+# Save the state of a sampler.
+# sampler      ... MetropolisHastings, HamiltonianMC or ParallelTempering
+#                  (anything with stateAttributes and rng).
+# extra        ... optional picklable dict stored alongside, e.g. the
+#                  number of chain blocks written so far.
+# pythonRandom ... also store the state of the "random" module, for scripts
+#                  that draw from it.
+def saveCheckpoint(sampler, filename, extra=None, pythonRandom=False):
+    if getattr(sampler, 'warmingUp', False):
+        raise ValueError("cannot checkpoint a %s during warm-up"
+                         % type(sampler).__name__)
+    state = {'class': type(sampler).__name__,
+             'attributes': dict((name, getattr(sampler, name))
+                                for name in sampler.stateAttributes),
+             'rng': sampler.rng.bit_generator.state,
+             'extra': extra}
+    if pythonRandom:
+        import random
+        state['random'] = random.getstate()
+    def write(temporary):
+        with open(temporary, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _atomicWrite(filename, write)
+
+
+# Restore the state written by saveCheckpoint into an existing sampler
+# (constructed with the same settings). Returns the extra dict.
+def loadCheckpoint(sampler, filename):
+    with open(filename, 'rb') as f:
+        state = pickle.load(f)
+    if state['class'] != type(sampler).__name__:
+        raise ValueError("checkpoint %s belongs to a %s, not a %s"
+                         % (filename, state['class'], type(sampler).__name__))
+    for name, value in state['attributes'].items():
+        setattr(sampler, name, value)
+    sampler.rng.bit_generator.state = state['rng']
+    if 'random' in state:
+        import random
+        random.setstate(state['random'])
+    return state['extra']
+
+
+# Run a sampler for n_steps steps in blocks of blockSize, storing the chain
+# in a ChainStore in directory and a checkpoint after every block. If the
+# directory already holds a checkpoint, the run continues from there.
+# Returns the ChainStore.
+def runWithCheckpoints(sampler, n_steps, directory, blockSize=1000,
+                       pythonRandom=False):
+    store = ChainStore(directory)
+    checkpoint = os.path.join(directory, 'checkpoint.pkl')
+    if os.path.exists(checkpoint):
+        extra = loadCheckpoint(sampler, checkpoint)
+        # Blocks written after the last checkpoint are produced again.
+        store.truncate(extra['nBlocks'])
+        done = extra['nSteps']
+    else:
+        store.truncate(0)
+        done = 0
+    while done < n_steps:
+        block = sampler.run(min(blockSize, n_steps - done))
+        store.append(block)
+        done = done + len(block)
+        saveCheckpoint(sampler, checkpoint, {'nBlocks': store.nBlocks, 'nSteps': done},
+                       pythonRandom)
+    return store
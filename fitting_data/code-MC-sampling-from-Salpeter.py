@@ -1,33 +1,13 @@
 import numpy,math
 import matplotlib.pyplot as plt
-import random as random
 
-random.seed(1)  # set random seed.
+rng = numpy.random.default_rng(1)  # set random seed.
 
-def sampleFromSalpeter(N, alpha, M_min, M_max):
-	# Convert limits from M to logM.
-	log_M_Min = math.log(M_min)
-	log_M_Max = math.log(M_max)
-	# Since Salpeter SMF decays, maximum likelihood occurs at M_min
-	maxlik = math.pow(M_min, 1.0 - alpha)
-	
-	# Prepare array for output masses.
-	Masses = []
-	# Fill in array.
-	while (len(Masses) < N):
-		# Draw candidate from logM interval.
-		logM = random.uniform(log_M_Min,log_M_Max)
-		M    = math.exp(logM)
-		# Compute likelihood of candidate from Salpeter SMF.
-		likelihood = math.pow(M, 1.0 - alpha)
-		# Accept randomly.
-		u = random.uniform(0.0,maxlik)
-		if (u < likelihood):
-			Masses.append(M)
-	return Masses
+# Vectorised inverse-CDF sampler shared by all scripts.
+from salpeter_sampling import sampleFromSalpeter
 
 # Draw samples.
-Masses = sampleFromSalpeter(1000000, 2.35, 1.0, 100.0)
+Masses = sampleFromSalpeter(1000000, 2.35, 1.0, 100.0, rng)
 # Convert to logM.
 LogMasses = numpy.log(numpy.array(Masses))
 
@@ -1,4 +1,4 @@
-import numpy,math
+import numpy
 import matplotlib.pyplot as plt
 
 # Create 1D Gaussian toy data.
@@ -19,22 +19,17 @@ b_min = -1.0
 b_max =  1.0
 # Number of steps of grid.
 Steps = 51
-# Allocate grid as matrix.
-Grid  = numpy.zeros([Steps,Steps])
-# Try all parameter combinations.
-for s1 in range(Steps):
-    for s2 in range(Steps):
-        # Current parameter combination.
-        a = a_min + (a_max - a_min)*float(s1)/float(Steps-1)
-        b = b_min + (b_max - b_min)*float(s2)/float(Steps-1)
-        
-        # Evaluate chi-squared.
-        chi2 = 0.0
-        for n in range(len(Data)):
-            # Use index n as pseudo-position
-            residual = (Data[n] - a - n*b)
-            chi2     = chi2 + residual*residual
-        Grid[Steps-1-s2,s1] = chi2
+# Evaluate chi-squared for all parameter combinations at once.
+# Use index n as pseudo-position.
+from grid_scan import chi2Grid
+def model(x, a, b):
+    return a + x*b
+Scan = chi2Grid(model, [numpy.linspace(a_min, a_max, Steps),
+                        numpy.linspace(b_min, b_max, Steps)],
+                numpy.arange(len(Data)), Data)
+# Grid[Steps-1-s2,s1] holds chi2 of a_s1 and b_s2, as needed for imshow.
+Grid  = Scan.image()
+print("Best fit: a = "+str(Scan.best[0])+", b = "+str(Scan.best[1]))
 
 plt.figure(1, figsize=(8,3))
 image = plt.imshow(Grid, vmin=numpy.min(Grid), vmax=numpy.min(Grid)+20.0, extent=[a_min,a_max,b_min,b_max])
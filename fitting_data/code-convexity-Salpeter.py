@@ -1,24 +1,14 @@
-import math
+import numpy
 from pylab import *
+from salpeter_curvature import fisherInformation
 
 Mmin = 1.0
 Mmax = 100.0
-logMmin = math.log(Mmin)
-logMmax = math.log(Mmax)
 
-A = []
-F = []
-for n in range(5001):
-	alpha = 1.001 + 9.0*float(n)/5000.0
-	
-	term_1 = 1.0/(1.0 - alpha)
-	
-	term_2 = (math.pow(Mmin,1.0-alpha)*logMmin - math.pow(Mmax,1.0-alpha)*logMmax)/(math.pow(Mmax,1.0-alpha) - math.pow(Mmin,1.0-alpha))
-	
-	term_3 = (math.pow(Mmax,1.0-alpha)*logMmax*logMmax - math.pow(Mmin,1.0-alpha)*logMmin*logMmin)/(math.pow(Mmax,1.0-alpha) - math.pow(Mmin,1.0-alpha))
-	
-	A.append(alpha)
-	F.append(term_1*term_1 + term_2*term_2 + term_3)
+# Minus the second derivative of the log-likelihood per star, i.e. the
+# variance of log(M), for all alpha at once.
+A = 1.001 + 9.0*numpy.arange(5001)/5000.0
+F = fisherInformation(A, Mmin, Mmax)
 
 figure(1)
 plot(A, F, '-', lw=3, color='black')
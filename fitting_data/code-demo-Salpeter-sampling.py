@@ -3,28 +3,10 @@ import matplotlib.pyplot as plt
 import random as random
 
 random.seed(1)  # set random seed.
+rng = numpy.random.default_rng(1)  # seed for drawing the toy data.
 
-def sampleFromSalpeter(N, alpha, M_min, M_max):
-	# Convert limits from M to logM.
-	log_M_Min = math.log(M_min)
-	log_M_Max = math.log(M_max)
-	# Since Salpeter SMF decays, maximum likelihood occurs at M_min
-	maxlik = math.pow(M_min, 1.0 - alpha)
-	
-	# Prepare array for output masses.
-	Masses = []
-	# Fill in array.
-	while (len(Masses) < N):
-		# Draw candidate from logM interval.
-		logM = random.uniform(log_M_Min,log_M_Max)
-		M    = math.exp(logM)
-		# Compute likelihood of candidate from Salpeter SMF.
-		likelihood = math.pow(M, 1.0 - alpha)
-		# Accept randomly.
-		u = random.uniform(0.0,maxlik)
-		if (u < likelihood):
-			Masses.append(M)
-	return Masses
+# Vectorised inverse-CDF sampler shared by all scripts.
+from salpeter_sampling import sampleFromSalpeter
 
 def evaluateLogLikelihood(alpha, D, N, M_min, M_max):
 	# Compute normalisation constant.
@@ -37,7 +19,7 @@ N      = 1000000
 alpha  = 2.35
 M_min  = 1.0
 M_max  = 100.0
-Masses = sampleFromSalpeter(N, alpha, M_min, M_max)
+Masses = sampleFromSalpeter(N, alpha, M_min, M_max, rng)
 LogM   = numpy.log(numpy.array(Masses))
 D      = numpy.mean(LogM)*N
 
@@ -68,13 +50,11 @@ for n in range(10000):
 		else:
 			A.append(old_alpha)
 
-print "Acceptance rate = "+str(accepted/10000.0)
+print("Acceptance rate = "+str(accepted/10000.0))
 
 # Discard first half of MCMC chain and thin out the rest.
-Clean = []
-for n in range(5000,10000):
-	if (n % 10 == 0):
-		Clean.append(A[n])
+from chain_diagnostics import cleanChain
+Clean = cleanChain(numpy.array(A), 5000, 10)
 
 plt.figure(1)
 plt.hist(Clean, 20, histtype='step', lw=3)
@@ -1,3 +1,4 @@
+import numpy
 import matplotlib.pyplot as plt
 
 # Create toy data.
@@ -9,28 +10,21 @@ sigma = [1.0,1.0,1.0,1.0,1.0,1.0]
 x0    = [0.5, 1.5]
 alpha = 0.01
 
-# Store initial guess for plotting.
-A = [x0[0]]
-B = [x0[1]]
-
-# Iteration.
-for i in range(50):
-	a = x0[0]
-	b = x0[1]
-	# Compute gradients of chi2 w.r.t. a and b.
-	grad_a = 0.0
-	grad_b = 0.0
-	for n in range(len(xdata)):
-		grad_a = grad_a - 2.0*(ydata[n] - a - b*xdata[n])*1.0/(sigma[n]*sigma[n])
-		grad_b = grad_b - 2.0*(ydata[n] - a - b*xdata[n])*xdata[n]/(sigma[n]*sigma[n])
-	# Update parameters.
-	a_new = a - alpha*grad_a
-	b_new = b - alpha*grad_b
-	x0    = [a_new,b_new]
-	
-	# Store parameters for plotting.
-	A.append(a_new)
-	B.append(b_new)
+# Straight line and its derivatives w.r.t. a and b, for all x at once.
+def model(x, params):
+	return params[0] + params[1]*x
+def jacobian(x, params):
+	return numpy.column_stack([numpy.ones_like(x), x])
+
+from gradient_descent import LeastSquaresProblem, minimise
+Problem = LeastSquaresProblem(model, jacobian, numpy.array(xdata),
+                              numpy.array(ydata), numpy.array(sigma))
+# 50 iterations of gradient descent using all data.
+Result = minimise(Problem.gradient, x0, method='gd', learningRate=alpha,
+                  maxSteps=50, tol=0.0)
+# Route in parameter space for plotting, starting with the initial guess.
+A = Result.trajectory[:,0]
+B = Result.trajectory[:,1]
 
 # Plot route of gradient descent.
 plt.figure(1)
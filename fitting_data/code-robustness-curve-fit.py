@@ -1,5 +1,4 @@
-import numpy,math
-import scipy.optimize as optimization
+import numpy
 import matplotlib.pyplot as plt
 
 def func(x, a, b):
@@ -10,31 +9,31 @@ ydata = numpy.array([0.1,0.9,2.2,2.8,3.9,5.1])
 sigma = numpy.array([1.0,1.0,1.0,1.0,1.0,1.0])
 
 Steps = 101
-Chi2Manifold = numpy.zeros([Steps,Steps])
 amin = -7.0
 amax = +5.0
 bmin = -4.0
 bmax = +4.0
-for s1 in range(Steps):
-    for s2 in range(Steps):
-	a = amin + (amax - amin)*float(s1)/(Steps-1)
-	b = bmin + (bmax - bmin)*float(s2)/(Steps-1)
-	
-	chi2 = 0.0
-	for n in range(len(xdata)):
-		residual = (ydata[n] - func(xdata[n], a, b))/sigma[n]
-		chi2 = chi2 + residual*residual
-	Chi2Manifold[Steps-1-s2,s1] = chi2
+# func broadcasts, so the whole manifold is evaluated without loops.
+from grid_scan import chi2Grid
+Scan = chi2Grid(func, [numpy.linspace(amin, amax, Steps),
+                       numpy.linspace(bmin, bmax, Steps)], xdata, ydata, sigma)
+Chi2Manifold = Scan.image()
 
 plt.figure(1, figsize=(8,4.5))
 plt.subplots_adjust(left=0.09, bottom=0.09, top=0.97, right=0.99)
 image = plt.imshow(Chi2Manifold, vmax=50.0, extent=[amin, amax, bmin, bmax])
 
-for a_initial in -6.0, -4.0, -2.0, 0.0, 2.0, 4.0:
-	# Initial guess.
-	x0   = numpy.array([a_initial, -3.5])
-	xFit = optimization.curve_fit(func, xdata, ydata, x0, sigma)[0]
+# Run curve_fit from six initial guesses. Six small fits are done in this
+# process (nWorkers=1); worker processes would need the script to be
+# guarded by "if __name__ == '__main__':".
+from multi_start import multiStartFit
+Starts = numpy.array([[a_initial, -3.5] for a_initial in (-6.0, -4.0, -2.0, 0.0, 2.0, 4.0)])
+Result = multiStartFit(func, Starts, (xdata, ydata, sigma), nWorkers=1)
+for x0, xFit in zip(Result.starts, Result.endpoints):
 	plt.plot([x0[0], xFit[0]], [x0[1], xFit[1]], 'o-', ms=4, markeredgewidth=0, lw=2, color='orange')
+# Distinct minima found, best first.
+for minimum in Result.minima:
+	print(minimum)
 plt.colorbar(image)
 plt.xlim(amin, amax)
 plt.ylim(bmin, bmax)
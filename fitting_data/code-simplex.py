@@ -1,26 +1,24 @@
+import numpy
 from scipy.optimize import fmin as simplex
+from scipy.optimize import fmin_bfgs
+from models import Polynomial
 
-def func(params, X, Y):
-	# extract current values of fit parameters from input array
-	a = params[0]
-	b = params[1]
-	c = params[2]
-	# compute chi-square
-	chi2 = 0.0
-	for n in range(len(X)):
-		x = X[n]
-		# The function y(x) is a polynomial in this example.
-		y = a + b*x + c*x*x
-		
-		chi2 = chi2 + (Y[n] - y)*(Y[n] - y)
-	return chi2
+xdata = numpy.array([0.0,1.0,2.0,3.0,4.0,5.0])
+ydata = numpy.array([0.1,0.9,2.2,2.8,3.9,5.1])
+sigma = numpy.array([1.0,1.0,1.0,1.0,1.0,1.0])
 
-xdata = [0.0,1.0,2.0,3.0,4.0,5.0]
-ydata = [0.1,0.9,2.2,2.8,3.9,5.1]
-sigma = [1.0,1.0,1.0,1.0,1.0,1.0]
+# The function y(x) = a + b*x + c*x*x is a polynomial in this example.
+# chi2(params) evaluates it for all data points at once, gradient(params)
+# uses the analytic Jacobian of the polynomial.
+model = Polynomial(2)
+chi2, gradient = model.chi2Functions(xdata, ydata, sigma)
 
 #Initial guess.
 x0    = [0.0, 0.0, 0.0]
 
 # Apply downhill Simplex algorithm.
-print simplex(func, x0, args=(xdata, ydata), xtol=0.0001, ftol=0.0001, maxiter=None, full_output=0)
\ No newline at end of file
+print(simplex(chi2, x0, xtol=0.0001, ftol=0.0001, maxiter=None, full_output=0))
+
+# With the gradient available, a quasi-Newton method needs far fewer
+# function evaluations.
+print(fmin_bfgs(chi2, x0, fprime=gradient, disp=0))
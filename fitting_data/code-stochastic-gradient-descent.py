@@ -1,8 +1,8 @@
 import matplotlib.pyplot as plt
-import random as random
+import numpy
 
 # set random seed.
-random.seed(1)
+rng = numpy.random.default_rng(1)
 
 # Create toy data.
 xdata = [0.0,1.0,2.0,3.0,4.0,5.0]
@@ -13,26 +13,24 @@ sigma = [1.0,1.0,1.0,1.0,1.0,1.0]
 x0    = [0.5, 1.5]
 alpha = 0.01
 
-# Store initial guess for plotting.
-A = [x0[0]]
-B = [x0[1]]
-
-# Iteration.
-for i in range(300):
-	a = x0[0]
-	b = x0[1]
-	# Compute stochastic gradients of chi2 w.r.t. a and b.
-	n      = random.randint(0,len(xdata)-1)  # randomly chose data point
-	grad_a = - 2.0*(ydata[n] - a - b*xdata[n])*1.0/(sigma[n]*sigma[n])
-	grad_b = - 2.0*(ydata[n] - a - b*xdata[n])*xdata[n]/(sigma[n]*sigma[n])
-	# Update parameters.
-	a_new = a - alpha*grad_a
-	b_new = b - alpha*grad_b
-	x0    = [a_new,b_new]
-	
-	# Store parameters for plotting.
-	A.append(a_new)
-	B.append(b_new)
+# Straight line and its derivatives w.r.t. a and b, for all x at once.
+def model(x, params):
+	return params[0] + params[1]*x
+def jacobian(x, params):
+	return numpy.column_stack([numpy.ones_like(x), x])
+
+from gradient_descent import LeastSquaresProblem, minimise
+Problem = LeastSquaresProblem(model, jacobian, numpy.array(xdata),
+                              numpy.array(ydata), numpy.array(sigma))
+# 300 steps, each using a single data point (mini-batches of size 1) in
+# shuffled order. The gradient of one point is scaled by the number of
+# points, so the learning rate is reduced by that factor.
+Result = minimise(Problem.gradient, x0, nData=len(xdata), batchSize=1,
+                  method='gd', learningRate=alpha/len(xdata), maxSteps=300,
+                  tol=0.0, rng=rng)
+# Route in parameter space for plotting, starting with the initial guess.
+A = Result.trajectory[:,0]
+B = Result.trajectory[:,1]
 
 # Plot route of gradient descent.
 plt.figure(1)
@@ -5,10 +5,10 @@
 
 import numpy,math
 
-# Define model.
-def func4curve_fit(x, mu, sigma):
-    residual = (x-mu)/sigma
-    return numpy.exp(-residual*residual/2.0)
+# Define model. Gaussian() evaluates exp(-((x-mu)/sigma)^2/2) for all x at
+# once and also knows its derivatives w.r.t. (mu, sigma).
+from models import Gaussian
+func4curve_fit = Gaussian()
 
 # Create data.
 X = []
@@ -23,18 +23,21 @@ Y = Y + numpy.random.normal(0.0, 0.1, len(Y))
 import scipy.optimize as optimization
 
 guess = [1.0, 2.0]
-print optimization.curve_fit(func4curve_fit, X, Y, guess)
+print(optimization.curve_fit(func4curve_fit, X, Y, guess,
+                             jac=func4curve_fit.curveFitJacobian))
 
 
+# chi-square for Simplex. Defined at module level, so that it can also be
+# sent to worker processes (e.g. grid_scan.objectiveGridParallel with the
+# data bound by functools.partial).
 def func4Simplex(params, X, Y):
-	mu    = params[0]
-	sigma = params[1]
-	chi2  = 0.0
-	for n in range(len(X)):
-		residual = Y[n] - func4curve_fit(X[n], mu, sigma)
-		chi2 = chi2 + residual*residual
-	return chi2
+	residual = Y - func4curve_fit(X, *params)
+	return numpy.dot(residual, residual)
 
 from scipy.optimize import fmin as simplex
-print simplex(func4Simplex, guess, args=(X, Y))
+print(simplex(func4Simplex, guess, args=(X, Y)))
+
+# chi-square and its gradient with the data bound, for quasi-Newton methods.
+chi2, gradient4Simplex = func4curve_fit.chi2Functions(X, Y)
+print(optimization.fmin_bfgs(chi2, guess, fprime=gradient4Simplex, disp=0))
 
@@ -0,0 +1,154 @@
+"""
+First-order optimisers: gradient descent, mini-batch stochastic gradient
+descent, momentum and Adam.
+
+The optimiser only needs a function gradient(params, batch) that returns the
+gradient of the objective on a subset of the data; batch is either a slice
+or a sorted array of indices. LeastSquaresProblem provides this for chi-square
+with vectorised model and Jacobian functions. The data may be memory-mapped
+arrays: with shuffle='blocks' every mini-batch is a contiguous slice, and only
+the order of the slices is shuffled every epoch.
+"""
+import numpy
+
+
+class LeastSquaresProblem(object):
+
+    # model    ... function model(x, params) returning the model at all x.
+    # jacobian ... function jacobian(x, params) returning the (len(x), n_params)
+    #              array of derivatives of the model w.r.t. the parameters.
+    # xdata, ydata, sigma ... data; may be memory-mapped arrays.
+    def __init__(self, model, jacobian, xdata, ydata, sigma=None):
+        self.model    = model
+        self.jacobian = jacobian
+        self.xdata    = xdata
+        self.ydata    = ydata
+        self.sigma    = sigma
+
+    def __len__(self):
+        return len(self.ydata)
+
+    def _residual(self, params, batch):
+        x = numpy.asarray(self.xdata[batch])
+        r = numpy.asarray(self.ydata[batch]) - self.model(x, params)
+        if self.sigma is None:
+            return x, r, r
+        s = numpy.asarray(self.sigma[batch])
+        return x, r/s, r/(s*s)
+
+    # chi-square on the given batch of data points.
+    def chi2(self, params, batch=slice(None)):
+        x, r, w = self._residual(params, batch)
+        return numpy.dot(r, r)
+
+    # Gradient of chi-square on a batch, scaled by N/len(batch) such that it
+    # estimates the gradient of the full chi-square.
+    def gradient(self, params, batch=slice(None)):
+        x, r, w = self._residual(params, batch)
+        grad = -2.0*numpy.dot(w, self.jacobian(x, params))
+        return grad*(float(len(self))/len(r))
+
+
+class OptimiserResult(object):
+
+    # x          ... final parameters.
+    # trajectory ... (n_recorded, n_params) array of visited parameters,
+    #                starting with the initial guess.
+    # nSteps     ... number of parameter updates done.
+    # converged  ... True if the convergence criterion was met.
+    def __init__(self, x, trajectory, nSteps, converged):
+        self.x          = x
+        self.trajectory = trajectory
+        self.nSteps     = nSteps
+        self.converged  = converged
+
+
+# Iterate over the mini-batches of one epoch.
+def _batches(nData, batchSize, shuffle, rng):
+    if shuffle == 'blocks':
+        for start in rng.permutation(numpy.arange(0, nData, batchSize)):
+            yield slice(start, min(start + batchSize, nData))
+    elif shuffle == 'points':
+        perm = rng.permutation(nData)
+        for start in range(0, nData, batchSize):
+            # Sorted indices read memory-mapped data front to back.
+            yield numpy.sort(perm[start:start+batchSize])
+    else:
+        raise ValueError("shuffle must be 'points' or 'blocks'")
+
+
+# Minimise an objective with a first-order method.
+# gradient     ... function gradient(params, batch).
+# x0           ... initial guess.
+# nData        ... number of data points (needed for mini-batches).
+# batchSize    ... mini-batch size; None uses all data in every step.
+# method       ... 'gd'       plain (stochastic) gradient descent,
+#                  'momentum' heavy-ball momentum,
+#                  'adam'     Adam (Kingma & Ba 2014).
+# learningRate ... step size ("alpha" in gradient-methods.rst).
+# decay        ... the step size in epoch k is learningRate/(1 + decay*k);
+#                  a decaying step size lets mini-batch runs settle down.
+# maxSteps     ... maximal number of parameter updates.
+# tol          ... convergence threshold on the relative change of the
+#                  parameters, per step (full batch) or per epoch.
+# shuffle      ... 'points' or 'blocks', see module documentation.
+# recordEvery  ... store every recordEvery-th step in the trajectory.
+# Returns an OptimiserResult.
+def minimise(gradient, x0, nData=None, batchSize=None, method='adam',
+             learningRate=0.01, decay=0.0, maxSteps=10000, tol=1e-8, momentum=0.9,
+             beta1=0.9, beta2=0.999, epsilon=1e-8, shuffle='points',
+             recordEvery=1, rng=None):
+    if not isinstance(rng, numpy.random.Generator):
+        rng = numpy.random.default_rng(rng)
+    x = numpy.array(x0, dtype=numpy.float64)
+    trajectory = numpy.empty((maxSteps//recordEvery + 1, len(x)))
+    trajectory[0] = x
+    nRecorded = 1
+    # Momentum/Adam state.
+    v = numpy.zeros_like(x)
+    m = numpy.zeros_like(x)
+
+    fullBatch = batchSize is None or nData is None or batchSize >= nData
+
+    def epochs():
+        while True:
+            if fullBatch:
+                yield [slice(None)]
+            else:
+                yield _batches(nData, batchSize, shuffle, rng)
+
+    step      = 0
+    converged = False
+    for k, epoch in enumerate(epochs()):
+        xStart = x.copy()
+        rate   = learningRate/(1.0 + decay*k)
+        for batch in epoch:
+            g = gradient(x, batch)
+            if method == 'gd':
+                update = rate*g
+            elif method == 'momentum':
+                v = momentum*v + rate*g
+                update = v
+            elif method == 'adam':
+                t = step + 1
+                m = beta1*m + (1.0 - beta1)*g
+                v = beta2*v + (1.0 - beta2)*g*g
+                mHat = m/(1.0 - beta1**t)
+                vHat = v/(1.0 - beta2**t)
+                update = rate*mHat/(numpy.sqrt(vHat) + epsilon)
+            else:
+                raise ValueError("unknown method '%s'" % method)
+            x = x - update
+            step = step + 1
+            if step % recordEvery == 0:
+                trajectory[nRecorded] = x
+                nRecorded = nRecorded + 1
+            if step >= maxSteps:
+                break
+        change = numpy.sqrt(numpy.sum((x - xStart)**2))
+        if change <= tol*(numpy.sqrt(numpy.sum(x*x)) + tol):
+            converged = True
+            break
+        if step >= maxSteps:
+            break
+    return OptimiserResult(x, trajectory[:nRecorded], step, converged)
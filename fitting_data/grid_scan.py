@@ -0,0 +1,249 @@
+"""
+Brute-force chi-square scans over a grid of model parameters.
+
+The model is evaluated for a whole tile of parameter combinations at once by
+broadcasting: the parameters are passed as arrays of shape (T, 1) and the
+x-values as shape (1, n), so the model returns a (T, n) array. Tiles (and,
+for very large datasets, chunks of data points) are chosen such that no
+temporary array exceeds maxBytes, i.e. the full residual cube of shape
+(grid points, data points) is never allocated.
+"""
+import numpy,warnings
+
+
+class GridScanResult(object):
+
+    # axes ... list of 1-D arrays with the parameter values along each axis.
+    # chi2 ... chi-square manifold of shape (len(axes[0]), len(axes[1]), ...).
+    def __init__(self, axes, chi2):
+        self.axes = axes
+        self.chi2 = chi2
+
+    # Grid index of the minimum chi-square.
+    @property
+    def argmin(self):
+        return numpy.unravel_index(numpy.nanargmin(self.chi2), self.chi2.shape)
+
+    # Parameter values at the minimum chi-square.
+    @property
+    def best(self):
+        return numpy.array([ax[i] for ax, i in zip(self.axes, self.argmin)])
+
+    @property
+    def minimum(self):
+        return self.chi2[self.argmin]
+
+    # Profile chi-square along one parameter axis, i.e. the minimum over all
+    # other parameters for every value of this one.
+    def profile(self, axis):
+        other = tuple(i for i in range(self.chi2.ndim) if i != axis)
+        return numpy.nanmin(self.chi2, axis=other)
+
+    # Slice through the minimum along one parameter axis, keeping all other
+    # parameters fixed at their best values.
+    def slice(self, axis):
+        index = list(self.argmin)
+        index[axis] = slice(None)
+        return self.chi2[tuple(index)]
+
+    # Manifold of two parameters in image orientation, i.e. as the loops in
+    # code-brute-force-grid.py fill Grid[Steps-1-s2,s1]: the first parameter
+    # runs along x, the second along y from top to bottom.
+    def image(self):
+        if self.chi2.ndim != 2:
+            raise ValueError("image() requires a two-parameter grid")
+        return self.chi2.T[::-1]
+
+
+# Parameter values of a tile of flattened grid indices, each of shape (T, 1).
+def _tileParameters(axes, shape, indices):
+    multi = numpy.unravel_index(indices, shape)
+    return [ax[i][:,None] for ax, i in zip(axes, multi)]
+
+
+# Evaluate chi-square over the full parameter grid.
+# model    ... function model(x, p1, p2, ...) that broadcasts, e.g. the same
+#              function handed to curve_fit.
+# axes     ... list of 1-D arrays, the parameter values along each axis,
+#              e.g. [numpy.linspace(a_min, a_max, Steps), ...].
+# xdata    ... x-positions of the data.
+# ydata    ... observed values.
+# sigma    ... errors of ydata (default 1).
+# maxBytes ... memory limit for temporary arrays. Tiles that fit into the CPU
+#              cache are faster than large ones, hence the small default.
+#              From maxBytes/32 data points on (32768 by default), a tile
+#              holds a single grid point and the data are split into chunks
+#              of maxBytes/32 points, i.e. there is one model call per grid
+#              point and chunk. This is still fast for cheap models (a
+#              warning is issued); pass a larger maxBytes for models with a
+#              high cost per call.
+# Returns a GridScanResult.
+def chi2Grid(model, axes, xdata, ydata, sigma=None, maxBytes=1024*1024):
+    axes  = [numpy.asarray(ax, dtype=numpy.float64) for ax in axes]
+    xdata = numpy.asarray(xdata, dtype=numpy.float64)
+    ydata = numpy.asarray(ydata, dtype=numpy.float64)
+    if sigma is None:
+        weight = numpy.ones_like(ydata)
+    else:
+        weight = 1.0/numpy.asarray(sigma, dtype=numpy.float64)
+    shape = tuple(len(ax) for ax in axes)
+    size  = int(numpy.prod(shape))
+    n     = len(ydata)
+    # Several temporaries of shape (T, nChunk) exist at once.
+    budget = max(maxBytes//(8*4), 1)
+    nChunk = min(n, budget)
+    T      = max(budget//nChunk, 1)
+    if T == 1 and size > 1:
+        warnings.warn("chi2Grid: every tile holds one grid point (%d data points, maxBytes=%d), "
+                      "so the model is called %d times; a larger maxBytes gives fewer calls"
+                      % (n, maxBytes, size*((n + nChunk - 1)//nChunk)), stacklevel=2)
+    chi2   = numpy.empty(size)
+    for start in range(0, size, T):
+        indices = numpy.arange(start, min(start + T, size))
+        params  = _tileParameters(axes, shape, indices)
+        total   = numpy.zeros(len(indices))
+        for d in range(0, n, nChunk):
+            x = xdata[None,d:d+nChunk]
+            residual  = ydata[None,d:d+nChunk] - model(x, *params)
+            residual *= weight[None,d:d+nChunk]
+            total += numpy.einsum('ij,ij->i', residual, residual)
+        chi2[start:start+len(indices)] = total
+    return GridScanResult(axes, chi2.reshape(shape))
+
+
+# Chi-square of a model that only accepts scalar parameters, in a form that
+# can be sent to worker processes.
+# func   ... model func(x, p1, p2, ...) as for curve_fit.
+# scalar ... if True, func is also called for one data point at a time;
+#            otherwise it is called once with the whole xdata array.
+class Chi2Objective(object):
+
+    def __init__(self, func, xdata, ydata, sigma=None, scalar=False):
+        self.func   = func
+        self.xdata  = numpy.asarray(xdata, dtype=numpy.float64)
+        self.ydata  = numpy.asarray(ydata, dtype=numpy.float64)
+        if sigma is None:
+            sigma = numpy.ones_like(self.ydata)
+        self.sigma  = numpy.asarray(sigma, dtype=numpy.float64)
+        self.scalar = scalar
+
+    def __call__(self, params):
+        if self.scalar:
+            model = numpy.array([self.func(x, *params) for x in self.xdata])
+        else:
+            model = self.func(self.xdata, *params)
+        residual = (self.ydata - model)/self.sigma
+        return numpy.dot(residual, residual)
+
+
+# State of a worker process: the objective and the output array.
+_worker = {}
+
+def _initWorker(objective, axes, storage):
+    from multiprocessing import shared_memory
+    _worker['objective'] = objective
+    _worker['axes']      = axes
+    _worker['shape']     = tuple(len(ax) for ax in axes)
+    kind, name = storage
+    if kind == 'file':
+        _worker['out'] = numpy.load(name, mmap_mode='r+')
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+        _worker['shm'] = shm
+        _worker['out'] = numpy.ndarray(_worker['shape'], dtype=numpy.float64,
+                                       buffer=shm.buf)
+
+# Evaluate the objective on the flattened grid indices start..stop-1.
+def _evaluateBlock(start, stop):
+    objective = _worker['objective']
+    out   = _worker['out'].reshape(-1)
+    multi = numpy.unravel_index(numpy.arange(start, stop), _worker['shape'])
+    for k in range(stop - start):
+        params = [ax[i[k]] for ax, i in zip(_worker['axes'], multi)]
+        out[start+k] = objective(params)
+    if isinstance(_worker['out'], numpy.memmap):
+        _worker['out'].flush()
+    return start, stop
+
+
+# Evaluate an objective that cannot be vectorised (such as func4Simplex in
+# exercise.py, or Chi2Objective) over a parameter grid with a process pool.
+# The flattened grid is split into blocks, which the workers write directly
+# into a shared output array.
+# objective  ... function objective(params) returning a number; it must be
+#                picklable (i.e. defined at module level).
+# axes       ... list of 1-D arrays, the parameter values along each axis.
+# nWorkers   ... number of processes (default: number of CPUs).
+# blockSize  ... number of grid points per task.
+# progress   ... optional function progress(nDone, nBlocks), called in the
+#                main process whenever a block is finished.
+# checkpoint ... optional .npy filename. The manifold is then kept in that
+#                memory-mapped file and the finished blocks are recorded in
+#                checkpoint+'.done.npy'; calling again with the same file
+#                only evaluates the blocks that are still missing.
+# Returns a GridScanResult (grid points not evaluated are NaN).
+# Note: with the "spawn" start method (Windows, macOS) the calling script
+# needs an "if __name__ == '__main__':" guard.
+def objectiveGridParallel(objective, axes, nWorkers=None, blockSize=4096,
+                          progress=None, checkpoint=None):
+    import os
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from multiprocessing import shared_memory
+    axes    = [numpy.asarray(ax, dtype=numpy.float64) for ax in axes]
+    shape   = tuple(len(ax) for ax in axes)
+    size    = int(numpy.prod(shape))
+    nBlocks = (size + blockSize - 1)//blockSize
+
+    shm = None
+    if checkpoint is None:
+        shm  = shared_memory.SharedMemory(create=True, size=8*size)
+        out  = numpy.ndarray(shape, dtype=numpy.float64, buffer=shm.buf)
+        out[...] = numpy.nan
+        done = numpy.zeros(nBlocks, dtype=bool)
+        storage = ('shm', shm.name)
+    else:
+        doneFile = checkpoint + '.done.npy'
+        if os.path.exists(checkpoint) and os.path.exists(doneFile):
+            out  = numpy.load(checkpoint, mmap_mode='r+')
+            done = numpy.load(doneFile, mmap_mode='r+')
+            if out.shape != shape or len(done) != nBlocks:
+                raise ValueError("checkpoint %s does not match the grid" % checkpoint)
+        else:
+            out  = numpy.lib.format.open_memmap(checkpoint, mode='w+',
+                                                dtype=numpy.float64, shape=shape)
+            out[...] = numpy.nan
+            out.flush()
+            done = numpy.lib.format.open_memmap(doneFile, mode='w+',
+                                                dtype=bool, shape=(nBlocks,))
+        storage = ('file', checkpoint)
+
+    try:
+        todo  = [b for b in range(nBlocks) if not done[b]]
+        nDone = nBlocks - len(todo)
+        if todo:
+            with ProcessPoolExecutor(max_workers=nWorkers, initializer=_initWorker,
+                                     initargs=(objective, axes, storage)) as pool:
+                futures = [pool.submit(_evaluateBlock, b*blockSize,
+                                       min((b + 1)*blockSize, size)) for b in todo]
+                for future in as_completed(futures):
+                    start, stop = future.result()
+                    done[start//blockSize] = True
+                    nDone = nDone + 1
+                    if isinstance(done, numpy.memmap):
+                        done.flush()
+                    if progress is not None:
+                        progress(nDone, nBlocks)
+        chi2 = numpy.array(out)
+    finally:
+        if shm is not None:
+            del out
+            shm.close()
+            shm.unlink()
+    return GridScanResult(axes, chi2)
+
+
+# Parallel version of chi2Grid for models that do not broadcast over
+# parameters, see objectiveGridParallel for the remaining arguments.
+def chi2GridParallel(func, axes, xdata, ydata, sigma=None, scalar=False, **kwargs):
+    return objectiveGridParallel(Chi2Objective(func, xdata, ydata, sigma, scalar),
+                                 axes, **kwargs)
@@ -0,0 +1,241 @@
+"""
+Hamiltonian Monte-Carlo for many chains at once, with automatic tuning.
+
+All K chains are integrated together: every leapfrog step is a single
+vectorised call of the log-probability gradient on a (K, n_params) array.
+During warm-up the step size of every chain is tuned by dual averaging
+(Hoffman & Gelman 2014) towards a target acceptance rate, and a diagonal
+mass matrix is estimated from the warm-up samples. The trajectory length is
+then chosen in these whitened units, so neither the step size nor the number
+of leapfrog steps needs to be fixed by hand.
+"""
+import numpy,math
+
+from metropolis import allocateChain
+
+
+class HamiltonianMC(object):
+
+    # Attributes that make up the sampler state, see checkpoint.py. The
+    # state of the adaptation during warmup() is not part of it.
+    stateAttributes = ('position', 'logp', 'grad', 'stepsize', 'invMass',
+                       'metricKnown', 'accepted', 'iteration', 'warmingUp')
+
+    # logProbability   ... vectorised function mapping (K, n_params) to K values.
+    # gradient         ... vectorised gradient of logProbability, (K, n_params).
+    # initial          ... (K, n_params) array of starting points.
+    # stepsize         ... initial step size; found automatically if None.
+    # trajectoryLength ... integration time in units of the posterior width.
+    # targetAccept     ... acceptance rate aimed at during warm-up.
+    # maxSteps         ... upper limit of leapfrog steps per trajectory.
+    # invMass          ... optional diagonal inverse mass matrix (n_params,)
+    #                      or (K, n_params), e.g. the squared posterior width
+    #                      from salpeter_curvature. Warm-up then skips the
+    #                      phase of short trajectories.
+    # rng              ... numpy Generator or seed.
+    def __init__(self, logProbability, gradient, initial, stepsize=None,
+                 trajectoryLength=0.5*math.pi, targetAccept=0.8,
+                 maxSteps=1024, invMass=None, rng=None):
+        self.logProbability   = logProbability
+        self.gradient         = gradient
+        self.position         = numpy.array(initial, dtype=numpy.float64, ndmin=2)
+        self.trajectoryLength = trajectoryLength
+        self.targetAccept     = targetAccept
+        self.maxSteps         = maxSteps
+        if isinstance(rng, numpy.random.Generator):
+            self.rng = rng
+        else:
+            self.rng = numpy.random.default_rng(rng)
+        K, n = self.position.shape
+        # Log-probability and gradient at the current position are cached.
+        self.logp = numpy.asarray(logProbability(self.position), dtype=numpy.float64)
+        self.grad = numpy.asarray(gradient(self.position), dtype=numpy.float64)
+        # Diagonal inverse mass matrix, i.e. the estimated posterior variance.
+        self.invMass   = numpy.ones((K, n))
+        self.metricKnown = invMass is not None
+        if invMass is not None:
+            self.invMass = self.invMass*invMass
+        self.accepted  = numpy.zeros(K, dtype=numpy.int64)
+        self.iteration = 0
+        # True while warmup() runs (and after an interrupted warm-up).
+        self.warmingUp = False
+        if stepsize is None:
+            self.stepsize = self.findReasonableStepsize()
+        else:
+            self.stepsize = numpy.zeros(K) + stepsize
+
+    @property
+    def nChains(self):
+        return self.position.shape[0]
+
+    @property
+    def nParams(self):
+        return self.position.shape[1]
+
+    @property
+    def acceptanceRate(self):
+        return self.accepted/float(max(self.iteration, 1))
+
+    # Number of leapfrog steps for the next trajectory. It is jittered to
+    # avoid periodic orbits and shared by all chains, so they stay in step.
+    def _nLeapfrog(self):
+        n = self.trajectoryLength/numpy.median(self.stepsize)
+        n = n*self.rng.uniform(0.8, 1.2)
+        return int(min(max(math.ceil(n), 1), self.maxSteps))
+
+    # Integrate Hamilton's equations with the leapfrog scheme for all chains.
+    # Returns the final position, momentum, log-probability and gradient.
+    def leapfrog(self, q, p, grad, eps, nSteps):
+        eps = eps[:,None]
+        p = p + 0.5*eps*grad
+        for i in range(nSteps):
+            q    = q + eps*self.invMass*p
+            grad = numpy.asarray(self.gradient(q), dtype=numpy.float64)
+            if i < nSteps - 1:
+                p = p + eps*grad
+        p = p + 0.5*eps*grad
+        logp = numpy.asarray(self.logProbability(q), dtype=numpy.float64)
+        return q, p, logp, grad
+
+    def _kinetic(self, p):
+        return 0.5*numpy.sum(p*p*self.invMass, axis=1)
+
+    # Draw momenta and integrate one trajectory. Returns the proposal and the
+    # Metropolis acceptance probability of every chain.
+    def _propose(self, nSteps):
+        p0 = self.rng.standard_normal(self.position.shape)/numpy.sqrt(self.invMass)
+        # Diverging trajectories (too large step size) overflow; they are
+        # simply rejected below.
+        with numpy.errstate(invalid='ignore', over='ignore'):
+            q, p, logp, grad = self.leapfrog(self.position, p0, self.grad,
+                                             self.stepsize, nSteps)
+            # Remember, energy = -logp.
+            dH = (self._kinetic(p) - logp) - (self._kinetic(p0) - self.logp)
+            acceptProb = numpy.exp(numpy.minimum(-dH, 0.0))
+        acceptProb[~numpy.isfinite(acceptProb)] = 0.0
+        return q, logp, grad, acceptProb
+
+    # Heuristic of Hoffman & Gelman (2014, Alg. 4): double or halve the
+    # step size of each chain until a single leapfrog step has an
+    # acceptance probability of about 1/2.
+    def findReasonableStepsize(self, maxiter=100):
+        eps = numpy.ones(self.nChains)
+        self.stepsize = eps
+        accept    = self._propose(1)[3]
+        direction = numpy.where(accept > 0.5, 1.0, -1.0)
+        active    = numpy.ones(self.nChains, dtype=bool)
+        for i in range(maxiter):
+            logAccept = numpy.log(numpy.maximum(accept, 1e-300))
+            active    = active & (direction*logAccept > -direction*math.log(2.0))
+            if not numpy.any(active):
+                break
+            eps = numpy.where(active, eps*2.0**direction, eps)
+            self.stepsize = eps
+            accept = self._propose(1)[3]
+        return eps
+
+    # Advance all chains by one HMC step.
+    # nSteps ... number of leapfrog steps; chosen from the trajectory length
+    #            and the current step size if None.
+    def step(self, nSteps=None):
+        if nSteps is None:
+            nSteps = self._nLeapfrog()
+        q, logp, grad, acceptProb = self._propose(nSteps)
+        accept = self.rng.random(self.nChains) < acceptProb
+        self.position[accept] = q[accept]
+        self.logp[accept]     = logp[accept]
+        self.grad[accept]     = grad[accept]
+        self.accepted += accept
+        self.iteration += 1
+        return acceptProb
+
+    # Warm-up phase, following the schedule used by Stan. The step size of
+    # every chain is tuned by dual averaging throughout. Between 15% and 90%
+    # of the warm-up, the diagonal mass matrix is estimated (pooling all
+    # chains) in windows of doubling length; after each window the mass
+    # matrix is updated and the step size adaptation restarts. Until the
+    # first window is done (and unless invMass was given) the scale of the
+    # posterior is unknown, so the trajectories are kept short
+    # (initialSteps leapfrog steps).
+    # Warm-up samples are not stored. The adaptation state lives only in
+    # this call, so the sampler cannot be checkpointed until it returns.
+    def warmup(self, n_steps, gamma=0.05, t0=10.0, kappa=0.75,
+               initialSteps=10):
+        K, n = self.position.shape
+        self.warmingUp = True
+        # Ends of the mass matrix windows.
+        start   = int(0.15*n_steps)
+        stop    = int(0.90*n_steps)
+        ends    = []
+        size    = 25
+        while start < stop:
+            # The last window absorbs what would be too short a remainder.
+            if start + 3*size > stop:
+                size = stop - start
+            ends.append(start + size)
+            start = start + size
+            size  = 2*size
+        windowStart = int(0.15*n_steps)
+
+        def restart():
+            return (numpy.log(10.0*self.stepsize), numpy.zeros(K),
+                    numpy.zeros(K), 0)
+        mu, Hbar, logEpsBar, t = restart()
+
+        count = 0
+        mean  = numpy.zeros(n)
+        M2    = numpy.zeros(n)
+        for i in range(n_steps):
+            nSteps = None
+            if not self.metricKnown:
+                nSteps = min(self._nLeapfrog(), initialSteps)
+            acceptProb = self.step(nSteps)
+            # Dual averaging of log(stepsize) for every chain.
+            t    = t + 1
+            w    = 1.0/(t + t0)
+            Hbar = (1.0 - w)*Hbar + w*(self.targetAccept - acceptProb)
+            logEps    = mu - math.sqrt(t)/gamma*Hbar
+            eta       = t**(-kappa)
+            logEpsBar = eta*logEps + (1.0 - eta)*logEpsBar
+            self.stepsize = numpy.exp(logEps)
+            # Welford update of the pooled posterior variance, one batch of
+            # K chains at a time.
+            if windowStart <= i < stop:
+                batchMean = numpy.mean(self.position, axis=0)
+                batchM2   = numpy.sum((self.position - batchMean)**2, axis=0)
+                delta = batchMean - mean
+                total = count + K
+                mean  = mean + delta*K/total
+                M2    = M2 + batchM2 + delta*delta*count*K/total
+                count = total
+            if i + 1 in ends and count > 1:
+                var = M2/(count - 1)
+                # Shrink towards a small constant as in Stan.
+                var = (count/(count + 5.0))*var + 1e-3*(5.0/(count + 5.0))
+                self.invMass  = numpy.tile(var, (K, 1))
+                self.stepsize = self.findReasonableStepsize()
+                mu, Hbar, logEpsBar, t = restart()
+                count = 0
+                mean  = numpy.zeros(n)
+                M2    = numpy.zeros(n)
+                self.metricKnown = True
+        if t > 0:
+            self.stepsize = numpy.exp(logEpsBar)
+        self.accepted[:] = 0
+        self.iteration   = 0
+        self.warmingUp   = False
+
+    # Run n_steps HMC steps with fixed tuning and store every position.
+    # chain    ... optional preallocated (n_steps, K, n_params) array.
+    # filename ... store the chain in a memory-mapped .npy file instead.
+    def run(self, n_steps, chain=None, filename=None):
+        if chain is None:
+            chain = allocateChain(n_steps, self.nChains, self.nParams, filename)
+        elif chain.shape != (n_steps, self.nChains, self.nParams):
+            raise ValueError("chain must have shape (n_steps, K, n_params)")
+        for i in range(n_steps):
+            self.step()
+            chain[i] = self.position
+        if isinstance(chain, numpy.memmap):
+            chain.flush()
+        return chain
@@ -0,0 +1,88 @@
+"""
+Metropolis-Hastings sampling of many independent chains at once.
+
+All K chains are advanced together as a (K, n_params) array, so one call of
+the log-probability function evaluates K proposals. The chain is written
+into a preallocated (n_steps, K, n_params) array, which can also be a
+memory-mapped .npy file for runs that do not fit into memory.
+"""
+import numpy
+
+
+# Allocate storage for a chain of n_steps steps of K chains.
+# filename ... if given, the chain is a memory-mapped .npy file on disk
+#              that can be opened with numpy.load(filename, mmap_mode='r').
+def allocateChain(n_steps, K, n_params, filename=None):
+    shape = (n_steps, K, n_params)
+    if filename is None:
+        return numpy.empty(shape, dtype=numpy.float64)
+    return numpy.lib.format.open_memmap(filename, mode='w+',
+                                        dtype=numpy.float64, shape=shape)
+
+
+class MetropolisHastings(object):
+
+    # Attributes that make up the sampler state, see checkpoint.py.
+    stateAttributes = ('position', 'logp', 'stepsizes', 'accepted', 'iteration')
+
+    # logProbability ... vectorised function mapping a (K, n_params) array to
+    #                    K log-probabilities (up to a constant).
+    # initial        ... (K, n_params) array of starting points.
+    # stepsizes      ... standard deviations of the Gaussian proposal, one per
+    #                    parameter (or a single number).
+    # rng            ... numpy Generator or seed.
+    def __init__(self, logProbability, initial, stepsizes, rng=None):
+        self.logProbability = logProbability
+        self.position  = numpy.array(initial, dtype=numpy.float64, ndmin=2)
+        self.stepsizes = numpy.asarray(stepsizes, dtype=numpy.float64)
+        if isinstance(rng, numpy.random.Generator):
+            self.rng = rng
+        else:
+            self.rng = numpy.random.default_rng(rng)
+        # The log-probability of the current position is cached, so every
+        # step costs only one evaluation for the proposals.
+        self.logp      = numpy.asarray(logProbability(self.position), dtype=numpy.float64)
+        self.accepted  = numpy.zeros(self.nChains, dtype=numpy.int64)
+        self.iteration = 0
+
+    @property
+    def nChains(self):
+        return self.position.shape[0]
+
+    @property
+    def nParams(self):
+        return self.position.shape[1]
+
+    # Fraction of accepted proposals per chain.
+    @property
+    def acceptanceRate(self):
+        return self.accepted/float(max(self.iteration, 1))
+
+    # Advance all chains by one step. Returns the new (K, n_params) position.
+    def step(self):
+        K, n = self.position.shape
+        proposal = self.position + self.stepsizes*self.rng.standard_normal((K, n))
+        new_logp = numpy.asarray(self.logProbability(proposal), dtype=numpy.float64)
+        # Accept in Monte-Carlo fashion; log(u) < new - old covers both the
+        # uphill case and the random downhill acceptance. NaNs are rejected.
+        accept = numpy.log(self.rng.random(K)) < new_logp - self.logp
+        self.position[accept] = proposal[accept]
+        self.logp[accept]     = new_logp[accept]
+        self.accepted += accept
+        self.iteration += 1
+        return self.position
+
+    # Run n_steps steps and store every position.
+    # chain    ... optional preallocated (n_steps, K, n_params) array.
+    # filename ... store the chain in a memory-mapped .npy file instead.
+    # Returns the chain array.
+    def run(self, n_steps, chain=None, filename=None):
+        if chain is None:
+            chain = allocateChain(n_steps, self.nChains, self.nParams, filename)
+        elif chain.shape != (n_steps, self.nChains, self.nParams):
+            raise ValueError("chain must have shape (n_steps, K, n_params)")
+        for n in range(n_steps):
+            chain[n] = self.step()
+        if isinstance(chain, numpy.memmap):
+            chain.flush()
+        return chain
@@ -0,0 +1,135 @@
+"""
+Fit models with vectorised values and analytic Jacobians.
+
+A Model knows its value and its derivatives w.r.t. the parameters for all
+data points at once. From this it builds the functions the scipy optimisers
+want: the model and jac for curve_fit, the residual function and Dfun for
+leastsq, and chi-square with its gradient for fmin/fmin_bfgs. Models without
+an analytic Jacobian fall back to central finite differences, which are
+still vectorised over the data.
+"""
+import numpy
+
+
+class Model(object):
+
+    # func     ... model func(x, p1, p2, ...), as for curve_fit; must accept
+    #              an array x.
+    # nParams  ... number of parameters.
+    # jacobian ... optional function jacobian(x, params) returning the
+    #              (len(x), nParams) array of derivatives. If None, finite
+    #              differences are used.
+    # step     ... relative step of the finite differences.
+    def __init__(self, func=None, nParams=None, jacobian=None, step=1e-6):
+        self.func      = func
+        self.nParams   = nParams
+        self._jacobian = jacobian
+        self.step      = step
+
+    # Model value at all x for one parameter vector.
+    def value(self, x, params):
+        return self.func(x, *params)
+
+    # curve_fit-style call, model(x, p1, p2, ...).
+    def __call__(self, x, *params):
+        return self.value(x, params)
+
+    # Derivatives of the model w.r.t. the parameters, shape (len(x), nParams).
+    def jacobian(self, x, params):
+        if self._jacobian is not None:
+            return self._jacobian(x, params)
+        return self.numericalJacobian(x, params)
+
+    # Central finite differences, one vectorised model evaluation per
+    # parameter and direction.
+    def numericalJacobian(self, x, params):
+        params = numpy.asarray(params, dtype=numpy.float64)
+        x = numpy.asarray(x, dtype=numpy.float64)
+        J = numpy.empty((x.size, len(params)))
+        for i in range(len(params)):
+            h = self.step*max(abs(params[i]), 1.0)
+            up   = params.copy()
+            down = params.copy()
+            up[i]   += h
+            down[i] -= h
+            J[:,i] = (self.value(x, up) - self.value(x, down)).ravel()/(2.0*h)
+        return J
+
+    # Jacobian in the form curve_fit's jac argument expects.
+    def curveFitJacobian(self, x, *params):
+        return self.jacobian(x, params)
+
+    # Residual function and its Jacobian (Dfun) for leastsq.
+    # Use as: leastsq(func, x0, Dfun=Dfun).
+    def leastsqFunctions(self, xdata, ydata, sigma=None):
+        xdata = numpy.asarray(xdata, dtype=numpy.float64)
+        ydata = numpy.asarray(ydata, dtype=numpy.float64)
+        if sigma is None:
+            weight = numpy.ones_like(ydata)
+        else:
+            weight = 1.0/numpy.asarray(sigma, dtype=numpy.float64)
+        def func(params):
+            return (ydata - self.value(xdata, params))*weight
+        def Dfun(params):
+            return -self.jacobian(xdata, params)*weight[:,None]
+        return func, Dfun
+
+    # chi-square and its gradient, e.g. for fmin or fmin_bfgs(f, x0, fprime=grad).
+    def chi2Functions(self, xdata, ydata, sigma=None):
+        func, Dfun = self.leastsqFunctions(xdata, ydata, sigma)
+        def chi2(params):
+            r = func(params)
+            return numpy.dot(r, r)
+        def gradient(params):
+            return 2.0*numpy.dot(func(params), Dfun(params))
+        return chi2, gradient
+
+
+class Polynomial(Model):
+
+    # y = p0 + p1*x + p2*x^2 + ... up to x^order.
+    def __init__(self, order):
+        Model.__init__(self, nParams=order + 1)
+        self.order = order
+
+    def value(self, x, params):
+        # Horner scheme.
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.zeros_like(x) + params[-1]
+        for p in params[-2::-1]:
+            y = y*x + p
+        return y
+
+    def jacobian(self, x, params):
+        return numpy.vander(numpy.asarray(x, dtype=numpy.float64), self.nParams,
+                            increasing=True)
+
+
+class Gaussian(Model):
+
+    # y = exp(-(x-mu)^2/(2*sigma^2)) with parameters (mu, sigma), as
+    # func4curve_fit in exercise.py. With amplitude=True the parameters are
+    # (A, mu, sigma) and y is multiplied by A.
+    def __init__(self, amplitude=False):
+        Model.__init__(self, nParams=3 if amplitude else 2)
+        self.amplitude = amplitude
+
+    def _split(self, params):
+        if self.amplitude:
+            return params[0], params[1], params[2]
+        return 1.0, params[0], params[1]
+
+    def value(self, x, params):
+        A, mu, sigma = self._split(params)
+        residual = (numpy.asarray(x, dtype=numpy.float64) - mu)/sigma
+        return A*numpy.exp(-residual*residual/2.0)
+
+    def jacobian(self, x, params):
+        A, mu, sigma = self._split(params)
+        residual = (numpy.asarray(x, dtype=numpy.float64) - mu)/sigma
+        g = numpy.exp(-residual*residual/2.0)
+        dmu    = A*g*residual/sigma
+        dsigma = A*g*residual*residual/sigma
+        if self.amplitude:
+            return numpy.column_stack([g, dmu, dsigma])
+        return numpy.column_stack([dmu, dsigma])
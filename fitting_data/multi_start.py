@@ -0,0 +1,204 @@
+"""
+Multi-start fitting of non-convex problems.
+
+A local optimiser (curve_fit, leastsq or Simplex) ends up in different
+minima depending on the initial guess, as code-robustness-curve-fit.py
+demonstrates. multiStartFit runs the optimiser from many start points
+(drawn from a grid, a Latin hypercube or a Sobol sequence) in a process
+pool, merges runs that converged to the same solution and returns the
+distinct minima ranked by chi-square, with their covariance matrices.
+"""
+import numpy
+import scipy.optimize as optimization
+
+
+# Draw n start points inside the box given by bounds.
+# bounds ... list of (min, max) pairs, one per parameter.
+# method ... 'grid'   regular grid with about n points,
+#            'lhs'    Latin hypercube,
+#            'sobol'  scrambled Sobol sequence (n is rounded up to a power of 2),
+#            'random' uniform random points.
+# rng    ... numpy Generator or seed.
+def startPoints(bounds, n, method='sobol', rng=None):
+    bounds = numpy.asarray(bounds, dtype=numpy.float64)
+    lower, upper = bounds[:,0], bounds[:,1]
+    d = len(bounds)
+    if method == 'grid':
+        steps = max(int(round(n**(1.0/d))), 1)
+        if steps == 1:
+            return numpy.array([0.5*(lower + upper)])
+        mesh = numpy.meshgrid(*[numpy.linspace(0.0, 1.0, steps)]*d, indexing='ij')
+        unit = numpy.column_stack([m.ravel() for m in mesh])
+    elif method in ('lhs', 'sobol'):
+        from scipy.stats import qmc
+        if method == 'lhs':
+            sampler = qmc.LatinHypercube(d, seed=rng)
+            unit = sampler.random(n)
+        else:
+            sampler = qmc.Sobol(d, scramble=True, seed=rng)
+            unit = sampler.random_base2(int(numpy.ceil(numpy.log2(max(n, 1)))))
+    elif method == 'random':
+        if not isinstance(rng, numpy.random.Generator):
+            rng = numpy.random.default_rng(rng)
+        unit = rng.random((n, d))
+    else:
+        raise ValueError("unknown method '%s'" % method)
+    return lower + unit*(upper - lower)
+
+
+# Covariance of the parameters from a numerical Hessian of chi-square,
+# cov = 2*H^-1. Used for Simplex, which provides no covariance itself.
+def _hessianCovariance(objective, x, args, h=1e-4):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    d = len(x)
+    step = h*numpy.maximum(numpy.abs(x), 1.0)
+    H = numpy.empty((d, d))
+    f0 = objective(x, *args)
+    for i in range(d):
+        for j in range(i, d):
+            ei = numpy.zeros(d)
+            ej = numpy.zeros(d)
+            ei[i] = step[i]
+            ej[j] = step[j]
+            if i == j:
+                H[i,i] = (objective(x + ei, *args) - 2.0*f0
+                          + objective(x - ei, *args))/(step[i]*step[i])
+            else:
+                H[i,j] = (objective(x + ei + ej, *args) - objective(x + ei - ej, *args)
+                          - objective(x - ei + ej, *args)
+                          + objective(x - ei - ej, *args))/(4.0*step[i]*step[j])
+                H[j,i] = H[i,j]
+    try:
+        return 2.0*numpy.linalg.inv(H)
+    except numpy.linalg.LinAlgError:
+        return numpy.full((d, d), numpy.inf)
+
+
+# Run one local fit from the start point x0. Module level, so that it can
+# be sent to worker processes. Returns (params, covariance, chi2, converged).
+def _fitOne(job):
+    method, func, x0, data, options = job
+    d = len(x0)
+    try:
+        if method == 'curve_fit':
+            xdata, ydata, sigma = data
+            popt, pcov = optimization.curve_fit(func, xdata, ydata, x0, sigma,
+                                                absolute_sigma=True, **options)
+            residual = (ydata - func(xdata, *popt))
+            if sigma is not None:
+                residual = residual/sigma
+            return popt, pcov, numpy.dot(residual, residual), True
+        elif method == 'leastsq':
+            x, cov, info, msg, ier = optimization.leastsq(func, x0, args=data,
+                                                          full_output=True, **options)
+            residual = info['fvec']
+            if cov is None:
+                cov = numpy.full((d, d), numpy.inf)
+            return x, cov, numpy.dot(residual, residual), ier in (1, 2, 3, 4)
+        elif method == 'fmin':
+            x, fopt, niter, nfev, warnflag = optimization.fmin(func, x0, args=data,
+                                                               full_output=True, disp=False,
+                                                               **options)
+            return x, _hessianCovariance(func, x, data), fopt, warnflag == 0
+        else:
+            raise ValueError("unknown method '%s'" % method)
+    except RuntimeError:
+        # curve_fit raises RuntimeError if it does not converge.
+        return numpy.full(d, numpy.nan), numpy.full((d, d), numpy.nan), numpy.inf, False
+
+
+class Minimum(object):
+
+    def __init__(self, params, covariance, chi2, start):
+        self.params     = params
+        self.covariance = covariance
+        self.chi2       = chi2
+        self.starts     = [start]   # all start points that ended up here
+
+    @property
+    def errors(self):
+        return numpy.sqrt(numpy.diag(self.covariance))
+
+    def __repr__(self):
+        return 'Minimum(chi2=%g, params=%s, found %d times)' % (self.chi2,
+                                                               self.params,
+                                                               len(self.starts))
+
+
+class MultiStartResult(object):
+
+    # starts    ... (n, d) array of start points.
+    # endpoints ... (n, d) array of fitted parameters of every run.
+    # chi2      ... chi-square of every run.
+    # converged ... boolean flag of every run.
+    # minima    ... list of distinct Minimum objects, best first.
+    def __init__(self, starts, endpoints, chi2, converged, minima):
+        self.starts    = starts
+        self.endpoints = endpoints
+        self.chi2      = chi2
+        self.converged = converged
+        self.minima    = minima
+
+    @property
+    def best(self):
+        return self.minima[0]
+
+
+# Merge runs that converged to the same point. Two solutions are the same if
+# all parameters agree within atol + rtol*|x|.
+def _distinctMinima(starts, endpoints, covariances, chi2, converged, rtol, atol):
+    minima = []
+    for k in numpy.argsort(chi2):
+        if not converged[k] or not numpy.isfinite(chi2[k]):
+            continue
+        x = endpoints[k]
+        for m in minima:
+            if numpy.all(numpy.abs(x - m.params) <= atol + rtol*numpy.abs(m.params)):
+                m.starts.append(starts[k])
+                break
+        else:
+            minima.append(Minimum(x, covariances[k], chi2[k], starts[k]))
+    return minima
+
+
+# Fit from many start points concurrently.
+# func     ... for 'curve_fit': model func(x, p1, p2, ...);
+#              for 'leastsq':   residual function func(params, *data);
+#              for 'fmin':      objective function func(params, *data).
+#              It must be defined at module level to be sent to workers.
+# starts   ... (n, d) array of start points, e.g. from startPoints().
+# data     ... for 'curve_fit' the tuple (xdata, ydata, sigma), otherwise
+#              the extra arguments passed to func.
+# method   ... 'curve_fit', 'leastsq' or 'fmin'.
+# nWorkers ... number of processes; 1 fits serially in this process.
+# rtol, atol ... tolerances for merging identical solutions.
+# options  ... extra keyword arguments for the scipy optimiser.
+# Returns a MultiStartResult.
+def multiStartFit(func, starts, data, method='curve_fit', nWorkers=None,
+                  rtol=1e-4, atol=1e-6, options=None):
+    starts = numpy.atleast_2d(numpy.asarray(starts, dtype=numpy.float64))
+    if options is None:
+        options = {}
+    if method == 'curve_fit':
+        xdata, ydata, sigma = data
+        data = (numpy.asarray(xdata, dtype=numpy.float64),
+                numpy.asarray(ydata, dtype=numpy.float64),
+                None if sigma is None else numpy.asarray(sigma, dtype=numpy.float64))
+    jobs = [(method, func, x0, data, options) for x0 in starts]
+    if nWorkers == 1:
+        results = [_fitOne(job) for job in jobs]
+    else:
+        import os
+        from concurrent.futures import ProcessPoolExecutor
+        if nWorkers is None:
+            nWorkers = os.cpu_count() or 1
+        # Send several fits per task to keep the communication overhead low.
+        chunksize = max(len(jobs)//(4*nWorkers), 1)
+        with ProcessPoolExecutor(max_workers=nWorkers) as pool:
+            results = list(pool.map(_fitOne, jobs, chunksize=chunksize))
+    endpoints   = numpy.array([r[0] for r in results])
+    covariances = numpy.array([r[1] for r in results])
+    chi2        = numpy.array([r[2] for r in results])
+    converged   = numpy.array([r[3] for r in results])
+    minima = _distinctMinima(starts, endpoints, covariances, chi2, converged, rtol, atol)
+    return MultiStartResult(starts, endpoints, chi2, converged, minima)
@@ -0,0 +1,202 @@
+"""
+Parallel tempering (replica exchange) for multimodal posteriors.
+
+A ladder of temperatures T_0 = 1 < T_1 < ... runs nWalkers Metropolis chains
+each, sampling prior*likelihood^(1/T). Hot chains move freely between
+separated minima (such as b and -b in code-robustness-curve-fit.py); swap
+moves between neighbouring temperatures hand these states down to the cold
+chain, which samples the actual posterior. All chains of all temperatures are
+evaluated as one batch of shape (nTemps*nWalkers, n_params), optionally split
+across a pool of worker processes. During warm-up the temperature spacing is
+adapted such that all neighbouring pairs swap equally often (Vousden, Farr &
+Mandel 2016).
+"""
+import numpy
+
+from metropolis import allocateChain
+
+
+class ParallelTempering(object):
+
+    # Attributes that make up the sampler state, see checkpoint.py. The
+    # state of the ladder adaptation during warmup() is not part of it.
+    stateAttributes = ('position', 'logl', 'logp', 'stepsizes', 'temperatures',
+                       'accepted', 'swapsAccepted', 'swapsProposed', 'iteration',
+                       'warmingUp')
+
+    # logLikelihood ... vectorised function mapping (M, n_params) to M values.
+    # initial       ... (nWalkers, n_params) starting points, used for every
+    #                   temperature, or (nTemps, nWalkers, n_params).
+    # stepsizes     ... proposal widths of the cold chains, per parameter; at
+    #                   temperature T they are scaled by sqrt(T).
+    # nTemps        ... number of temperatures.
+    # maxTemp       ... highest temperature of the initial geometric ladder.
+    # logPrior      ... optional vectorised log-prior (not tempered).
+    # swapInterval  ... attempt swaps every swapInterval steps.
+    # pool          ... optional executor/pool with a map method; the batch is
+    #                   then split into one chunk per worker. logLikelihood
+    #                   must be picklable in that case.
+    # nChunks       ... number of chunks for the pool.
+    # rng           ... numpy Generator or seed.
+    def __init__(self, logLikelihood, initial, stepsizes, nTemps=8, maxTemp=100.0,
+                 logPrior=None, swapInterval=1, pool=None, nChunks=None, rng=None):
+        self.logLikelihood = logLikelihood
+        self.logPrior      = logPrior
+        self.stepsizes     = numpy.asarray(stepsizes, dtype=numpy.float64)
+        self.swapInterval  = swapInterval
+        self.pool          = pool
+        self.nChunks       = nChunks
+        if isinstance(rng, numpy.random.Generator):
+            self.rng = rng
+        else:
+            self.rng = numpy.random.default_rng(rng)
+        initial = numpy.array(initial, dtype=numpy.float64)
+        if initial.ndim == 2:
+            initial = numpy.tile(initial, (nTemps, 1, 1))
+        self.position = initial
+        self.temperatures = numpy.geomspace(1.0, maxTemp, nTemps)
+        self.logl, self.logp = self._evaluate(self.position)
+        self.resetCounters()
+        # True while warmup() runs (and after an interrupted warm-up).
+        self.warmingUp = False
+
+    @property
+    def nTemps(self):
+        return self.position.shape[0]
+
+    @property
+    def nWalkers(self):
+        return self.position.shape[1]
+
+    @property
+    def nParams(self):
+        return self.position.shape[2]
+
+    @property
+    def betas(self):
+        return 1.0/self.temperatures
+
+    # Fraction of accepted Metropolis proposals, (nTemps, nWalkers).
+    @property
+    def acceptanceRate(self):
+        return self.accepted/float(max(self.iteration, 1))
+
+    # Fraction of accepted swaps between temperature i and i+1, (nTemps-1,).
+    @property
+    def swapAcceptance(self):
+        return self.swapsAccepted/numpy.maximum(self.swapsProposed, 1).astype(numpy.float64)
+
+    def resetCounters(self):
+        self.accepted      = numpy.zeros((self.nTemps, self.nWalkers), dtype=numpy.int64)
+        self.swapsAccepted = numpy.zeros(self.nTemps - 1, dtype=numpy.int64)
+        self.swapsProposed = numpy.zeros(self.nTemps - 1, dtype=numpy.int64)
+        self.iteration     = 0
+
+    # Log-likelihood and log-prior of a (nTemps, nWalkers, n_params) array.
+    def _evaluate(self, position):
+        flat = position.reshape(-1, self.nParams)
+        if self.logPrior is None:
+            logp = numpy.zeros(len(flat))
+        else:
+            logp = numpy.asarray(self.logPrior(flat), dtype=numpy.float64)
+        logl = numpy.full(len(flat), -numpy.inf)
+        # The likelihood is not evaluated outside of the prior.
+        ok = numpy.isfinite(logp)
+        if numpy.any(ok):
+            if self.pool is None:
+                logl[ok] = self.logLikelihood(flat[ok])
+            else:
+                nChunks = self.nChunks
+                if nChunks is None:
+                    import os
+                    nChunks = os.cpu_count() or 1
+                chunks  = numpy.array_split(flat[ok], nChunks)
+                results = self.pool.map(self.logLikelihood, [c for c in chunks if len(c)])
+                logl[ok] = numpy.concatenate([numpy.asarray(r, dtype=numpy.float64)
+                                              for r in results])
+        shape = position.shape[:2]
+        return logl.reshape(shape), logp.reshape(shape)
+
+    # One Metropolis step of every chain at its own temperature.
+    def step(self):
+        scale = self.stepsizes*numpy.sqrt(self.temperatures)[:,None,None]
+        proposal   = self.position + scale*self.rng.standard_normal(self.position.shape)
+        logl, logp = self._evaluate(proposal)
+        beta  = self.betas[:,None]
+        with numpy.errstate(invalid='ignore'):
+            delta = (logp + beta*logl) - (self.logp + beta*self.logl)
+        accept = numpy.log(self.rng.random(delta.shape)) < delta
+        self.position[accept] = proposal[accept]
+        self.logl[accept]     = logl[accept]
+        self.logp[accept]     = logp[accept]
+        self.accepted += accept
+        self.iteration += 1
+
+    # Propose swaps between all neighbouring temperatures, from the hottest
+    # pair down to the coldest, for all walkers at once. Returns the
+    # fraction of accepted swaps per pair.
+    def swap(self):
+        betas = self.betas
+        fraction = numpy.zeros(self.nTemps - 1)
+        for i in range(self.nTemps - 2, -1, -1):
+            with numpy.errstate(invalid='ignore'):
+                delta = (betas[i] - betas[i+1])*(self.logl[i+1] - self.logl[i])
+            accept = numpy.log(self.rng.random(self.nWalkers)) < delta
+            for array in (self.position, self.logl, self.logp):
+                hot = array[i+1][accept].copy()
+                array[i+1][accept] = array[i][accept]
+                array[i][accept]   = hot
+            self.swapsAccepted[i] += numpy.sum(accept)
+            self.swapsProposed[i] += self.nWalkers
+            fraction[i] = numpy.mean(accept)
+        return fraction
+
+    # Warm-up with adaptation of the temperature ladder. The log-spacings
+    # log(T_i - T_i-1) of the inner temperatures are moved by
+    # kappa(t)*(A_i-1 - A_i), where A_i is the swap acceptance of pair i,
+    # until all pairs swap equally often. T_0 = 1 and the highest
+    # temperature stay fixed.
+    # nu, t0 ... adaptation rate 1/nu and its decay time (in swaps).
+    # Counters are reset afterwards, samples are not stored. The swap count
+    # lives only in this call, so the sampler cannot be checkpointed until
+    # it returns.
+    def warmup(self, n_steps, nu=100.0, t0=1000.0):
+        self.warmingUp = True
+        nSwaps = 0
+        for n in range(n_steps):
+            self.step()
+            if (n + 1) % self.swapInterval != 0:
+                continue
+            A = self.swap()
+            nSwaps = nSwaps + 1
+            if self.nTemps < 3:
+                continue
+            kappa   = t0/(nSwaps + t0)/nu
+            spacing = numpy.diff(self.temperatures)[:-1]*numpy.exp(kappa*(A[:-1] - A[1:]))
+            self.temperatures[1:-1] = 1.0 + numpy.cumsum(spacing)
+        self.resetCounters()
+        self.warmingUp = False
+
+    # Run n_steps steps (with swaps every swapInterval steps) and store the
+    # cold chains.
+    # chain    ... optional preallocated (n_steps, nWalkers, n_params) array.
+    # filename ... store the chain in a memory-mapped .npy file instead.
+    # allTemps ... store all temperatures, (n_steps, nTemps, nWalkers, n_params),
+    #              e.g. for thermodynamic integration. The .npy file then
+    #              has shape (n_steps, nTemps*nWalkers, n_params).
+    def run(self, n_steps, chain=None, filename=None, allTemps=False):
+        if chain is None:
+            if allTemps:
+                chain = allocateChain(n_steps, self.nTemps*self.nWalkers, self.nParams,
+                                      filename).reshape(n_steps, self.nTemps,
+                                                        self.nWalkers, self.nParams)
+            else:
+                chain = allocateChain(n_steps, self.nWalkers, self.nParams, filename)
+        for n in range(n_steps):
+            self.step()
+            if (n + 1) % self.swapInterval == 0:
+                self.swap()
+            chain[n] = self.position if allTemps else self.position[0]
+        if isinstance(chain, numpy.memmap):
+            chain.flush()
+        return chain
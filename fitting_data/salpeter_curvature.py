@@ -0,0 +1,142 @@
+"""
+Fisher information and curvature of the truncated power-law likelihood.
+
+The second derivative of the Salpeter log-likelihood is -N times the variance
+of log(M) under the power law, i.e. the Fisher information per star,
+
+  I(alpha) = Var[log M] = log(M_max/M_min)^2 * g''((1-alpha)*log(M_max/M_min)),
+
+with g(x) = log((exp(x)-1)/x). It depends on the mass limits only through
+their ratio and does not depend on the data at all. fisherInformation
+evaluates it for arrays of alpha and of mass limits. CurvatureTable
+tabulates it once on a regular alpha grid, after which the curvature,
+the posterior width and a step size for MCMC are looked up in O(1).
+Tables are cached in memory and, optionally, as .npz files on disk.
+"""
+import numpy,os
+
+from salpeter_likelihood import _logRelExpm1Second
+
+
+# Fisher information per star, Var[log M], of a power law with index alpha
+# truncated to [M_min, M_max]. All arguments broadcast.
+def fisherInformation(alpha, M_min, M_max):
+    alpha    = numpy.asarray(alpha, dtype=numpy.float64)
+    logRatio = numpy.log(numpy.asarray(M_max, dtype=numpy.float64)/M_min)
+    x = (1.0 - alpha)*logRatio
+    return logRatio*logRatio*_logRelExpm1Second(x)
+
+
+# Second derivative of the log-likelihood of N stars w.r.t. alpha.
+def curvature(alpha, N, M_min, M_max):
+    return -numpy.asarray(N, dtype=numpy.float64)*fisherInformation(alpha, M_min, M_max)
+
+
+class CurvatureTable(object):
+
+    # M_min, M_max ... mass limits, scalars or arrays (one table per pair).
+    # alphaMin, alphaMax, nAlpha ... regular alpha grid of the table. The
+    #              table stores log(I), which is smooth, so linear
+    #              interpolation is accurate to ~1e-6 with the default grid.
+    def __init__(self, M_min, M_max, alphaMin=-1.0, alphaMax=11.0, nAlpha=4097):
+        M_min, M_max = numpy.broadcast_arrays(numpy.asarray(M_min, dtype=numpy.float64),
+                                              numpy.asarray(M_max, dtype=numpy.float64))
+        if numpy.any(M_min <= 0.0) or numpy.any(M_max <= M_min):
+            raise ValueError("require 0 < M_min < M_max")
+        self.M_min  = M_min
+        self.M_max  = M_max
+        self.alpha  = numpy.linspace(alphaMin, alphaMax, nAlpha)
+        self.dAlpha = self.alpha[1] - self.alpha[0]
+        # Shape M_min.shape + (nAlpha,).
+        self.logFisher = numpy.log(fisherInformation(self.alpha, M_min[...,None],
+                                                     M_max[...,None]))
+
+    def save(self, filename):
+        numpy.savez(filename, M_min=self.M_min, M_max=self.M_max,
+                    alpha=self.alpha, logFisher=self.logFisher)
+
+    @classmethod
+    def load(cls, filename):
+        data  = numpy.load(filename)
+        table = cls.__new__(cls)
+        table.M_min     = data['M_min']
+        table.M_max     = data['M_max']
+        table.alpha     = data['alpha']
+        table.dAlpha    = table.alpha[1] - table.alpha[0]
+        table.logFisher = data['logFisher']
+        return table
+
+    # Fisher information per star at alpha. alpha broadcasts against the
+    # shape of the mass limits; values outside the tabulated range are
+    # computed exactly.
+    def fisher(self, alpha):
+        alpha = numpy.asarray(alpha, dtype=numpy.float64)
+        shape = numpy.broadcast(alpha, self.M_min).shape
+        n     = len(self.alpha)
+        table = self.logFisher.reshape(-1, n)
+        pair  = numpy.broadcast_to(numpy.arange(len(table)).reshape(self.M_min.shape), shape)
+        a     = numpy.broadcast_to(alpha, shape)
+        # Regular grid: the interval is found by division, not by search.
+        t = (a - self.alpha[0])/self.dAlpha
+        i = numpy.clip(numpy.floor(t).astype(numpy.int64), 0, n - 2)
+        w = t - i
+        result = numpy.exp((1.0 - w)*table[pair,i] + w*table[pair,i+1])
+        outside = (a < self.alpha[0]) | (a > self.alpha[-1])
+        if numpy.any(outside):
+            result[outside] = fisherInformation(a[outside],
+                                                numpy.broadcast_to(self.M_min, shape)[outside],
+                                                numpy.broadcast_to(self.M_max, shape)[outside])
+        return result
+
+    # Second derivative of the log-likelihood of N stars.
+    def curvature(self, alpha, N):
+        return -numpy.asarray(N, dtype=numpy.float64)*self.fisher(alpha)
+
+    # Width 1/sqrt(N*I) of the posterior of alpha for N stars (flat prior).
+    # This is the natural proposal width for Metropolis-Hastings and the
+    # inverse mass (its square) for Hamiltonian Monte-Carlo.
+    def posteriorWidth(self, alpha, N):
+        return 1.0/numpy.sqrt(numpy.asarray(N, dtype=numpy.float64)*self.fisher(alpha))
+
+
+# Tables already built or loaded in this process.
+_tables = {}
+
+# File name of a cached table, a hash of the mass limits and the grid.
+def _cacheName(M_min, M_max, grid):
+    import hashlib
+    key = hashlib.sha1()
+    for array in (M_min, M_max, numpy.asarray(grid, dtype=numpy.float64)):
+        key.update(numpy.ascontiguousarray(array, dtype=numpy.float64).tobytes())
+        key.update(str(numpy.shape(array)).encode())
+    return 'salpeter_curvature_%s.npz' % key.hexdigest()[:16]
+
+
+# Get the CurvatureTable for the given mass limits, building it only if
+# it is neither in memory nor in cacheDir.
+# cacheDir ... directory of cached tables on disk; None keeps them in
+#              memory only.
+# grid     ... (alphaMin, alphaMax, nAlpha), see CurvatureTable.
+def curvatureTable(M_min, M_max, cacheDir=None, grid=(-1.0, 11.0, 4097)):
+    M_min = numpy.asarray(M_min, dtype=numpy.float64)
+    M_max = numpy.asarray(M_max, dtype=numpy.float64)
+    name  = _cacheName(M_min, M_max, grid)
+    if name in _tables:
+        return _tables[name]
+    filename = None
+    if cacheDir is not None:
+        filename = os.path.join(cacheDir, name)
+        if os.path.exists(filename):
+            _tables[name] = CurvatureTable.load(filename)
+            return _tables[name]
+    table = CurvatureTable(M_min, M_max, grid[0], grid[1], int(grid[2]))
+    if filename is not None:
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        # Write to a temporary file first, so that concurrent processes
+        # never read a half-written table.
+        temporary = filename + '.%d.tmp.npz' % os.getpid()
+        table.save(temporary)
+        os.replace(temporary, filename)
+    _tables[name] = table
+    return table
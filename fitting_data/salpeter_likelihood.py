@@ -0,0 +1,127 @@
+"""
+Likelihood of a truncated power-law (Salpeter) mass function.
+
+The data only enter the log-likelihood through the sufficient statistics
+N (number of stars) and D = sum(log M_n). A PowerLawLikelihood stores these
+once, after which the log-likelihood, gradient and Hessian can be evaluated
+for whole arrays of alpha without touching the masses again.
+"""
+import numpy,math
+
+
+# log((exp(x)-1)/x) and its first two derivatives, written such that they
+# are accurate near x=0 (alpha close to 1) and do not overflow for large |x|.
+def _logRelExpm1(x):
+    x      = numpy.asarray(x, dtype=numpy.float64)
+    result = numpy.empty_like(x)
+    small  = numpy.abs(x) < 1e-3
+    pos    = (x > 0.0) & ~small
+    neg    = (x < 0.0) & ~small
+    xs = x[small]
+    result[small] = xs/2.0 + xs*xs/24.0 - xs**4/2880.0
+    xp = x[pos]
+    result[pos] = xp + numpy.log(-numpy.expm1(-xp)) - numpy.log(xp)
+    xn = x[neg]
+    result[neg] = numpy.log(-numpy.expm1(xn)) - numpy.log(-xn)
+    return result
+
+def _logRelExpm1Prime(x):
+    x      = numpy.asarray(x, dtype=numpy.float64)
+    result = numpy.empty_like(x)
+    small  = numpy.abs(x) < 1e-3
+    xs = x[small]
+    result[small] = 0.5 + xs/12.0 - xs**3/720.0
+    xl = x[~small]
+    with numpy.errstate(over='ignore'):
+        result[~small] = -1.0/numpy.expm1(-xl) - 1.0/xl
+    return result
+
+def _logRelExpm1Second(x):
+    x      = numpy.asarray(x, dtype=numpy.float64)
+    result = numpy.empty_like(x)
+    small  = numpy.abs(x) < 0.05
+    xs = x[small]
+    x2 = xs*xs
+    result[small] = 1.0/12.0 - x2/240.0 + x2*x2/6048.0 - x2*x2*x2/172800.0
+    xl = x[~small]
+    with numpy.errstate(over='ignore'):
+        s = numpy.sinh(xl/2.0)
+        result[~small] = 1.0/(xl*xl) - 1.0/(4.0*s*s)
+    return result
+
+
+class PowerLawLikelihood(object):
+
+    # N     ... number of stars (scalar or array, one entry per catalogue).
+    # D     ... sum over log(M_n) (same shape as N).
+    # M_min ... lower limit of mass interval.
+    # M_max ... upper limit of mass interval.
+    def __init__(self, N, D, M_min, M_max):
+        if not (0.0 < M_min < M_max):
+            raise ValueError("require 0 < M_min < M_max")
+        self.N     = numpy.asarray(N, dtype=numpy.float64)
+        self.D     = numpy.asarray(D, dtype=numpy.float64)
+        self.M_min = float(M_min)
+        self.M_max = float(M_max)
+        self.log_M_min = math.log(self.M_min)
+        self.log_ratio = math.log(self.M_max/self.M_min)
+
+    # Build the likelihood from masses. Masses may be a single array or an
+    # iterable of arrays (e.g. chunks read from disk), so the full catalogue
+    # never needs to be in memory at once.
+    @classmethod
+    def fromMasses(cls, Masses, M_min, M_max):
+        like = cls(0.0, 0.0, M_min, M_max)
+        if isinstance(Masses, numpy.ndarray):
+            like.addMasses(Masses)
+        else:
+            for chunk in Masses:
+                like.addMasses(chunk)
+        return like
+
+    # Accumulate another chunk of masses into N and D.
+    def addMasses(self, Masses):
+        Masses = numpy.asarray(Masses, dtype=numpy.float64).ravel()
+        if Masses.size == 0:
+            return
+        if Masses.min() < self.M_min or Masses.max() > self.M_max:
+            raise ValueError("masses outside of [M_min, M_max]")
+        self.N = self.N + Masses.size
+        self.D = self.D + numpy.sum(numpy.log(Masses))
+
+    # Log of the normalisation integral int_{M_min}^{M_max} M^-alpha dM.
+    def logNormalisation(self, alpha):
+        beta = 1.0 - numpy.asarray(alpha, dtype=numpy.float64)
+        return (beta*self.log_M_min + math.log(self.log_ratio)
+                + _logRelExpm1(beta*self.log_ratio))
+
+    # Log-likelihood N*log(c) - alpha*D for an array of alpha values.
+    # alpha broadcasts against N and D.
+    def logLikelihood(self, alpha):
+        alpha = numpy.asarray(alpha, dtype=numpy.float64)
+        return -self.N*self.logNormalisation(alpha) - alpha*self.D
+
+    # First derivative of the log-likelihood w.r.t. alpha.
+    def gradient(self, alpha):
+        beta = 1.0 - numpy.asarray(alpha, dtype=numpy.float64)
+        # Mean of log(M) under the power law with index alpha.
+        meanLogM = self.log_M_min + self.log_ratio*_logRelExpm1Prime(beta*self.log_ratio)
+        return self.N*meanLogM - self.D
+
+    # Second derivative of the log-likelihood w.r.t. alpha (always negative).
+    def hessian(self, alpha):
+        beta = 1.0 - numpy.asarray(alpha, dtype=numpy.float64)
+        # Variance of log(M) under the power law with index alpha.
+        varLogM = self.log_ratio*self.log_ratio*_logRelExpm1Second(beta*self.log_ratio)
+        return -self.N*varLogM
+
+    # Maximum-likelihood alpha via Newton's method (the problem is concave).
+    # Works for many catalogues at once if N and D are arrays.
+    def maximumLikelihood(self, guess=2.0, tol=1e-12, maxiter=100):
+        alpha = numpy.zeros(numpy.broadcast(self.N, self.D).shape) + guess
+        for i in range(maxiter):
+            step  = self.gradient(alpha)/self.hessian(alpha)
+            alpha = alpha - step
+            if numpy.all(numpy.abs(step) < tol):
+                break
+        return alpha
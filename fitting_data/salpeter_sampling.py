@@ -0,0 +1,112 @@
+"""
+Vectorised Monte-Carlo sampling of stellar masses from a mass function.
+
+Two samplers are provided:
+
+* sampleFromSalpeter ... exact inverse-CDF sampling of a truncated power law.
+* sampleByRejection  ... batched rejection sampling for a general IMF.
+
+Both fill a preallocated float64 array chunk by chunk, so drawing 10^8
+masses never needs more temporary memory than a single chunk.
+"""
+import numpy,math
+
+# Default number of draws handled per chunk.
+CHUNK_SIZE = 1048576
+
+
+# Turn a seed (or None, or an existing Generator) into a numpy Generator.
+def getGenerator(rng=None):
+    if isinstance(rng, numpy.random.Generator):
+        return rng
+    return numpy.random.default_rng(rng)
+
+
+# Prepare the output array, either by allocating it or by checking the one given.
+def _prepareOutput(N, out):
+    if out is None:
+        return numpy.empty(N, dtype=numpy.float64)
+    if out.shape != (N,) or out.dtype != numpy.float64:
+        raise ValueError("out must be a float64 array of shape (%d,)" % N)
+    return out
+
+
+# Draw random samples from Salpeter IMF by inverting its CDF.
+# N          ... number of samples.
+# alpha      ... power-law index.
+# M_min      ... lower bound of mass interval.
+# M_max      ... upper bound of mass interval.
+# rng        ... numpy Generator or seed.
+# out        ... optional preallocated float64 array of length N.
+# chunk_size ... number of samples drawn per chunk.
+def sampleFromSalpeter(N, alpha, M_min, M_max, rng=None, out=None,
+                       chunk_size=CHUNK_SIZE):
+    rng = getGenerator(rng)
+    out = _prepareOutput(N, out)
+    log_ratio = math.log(M_max/M_min)
+    beta      = 1.0 - alpha
+    # With p(M) ~ M^-alpha the CDF is
+    #   u = (M^beta - M_min^beta)/(M_max^beta - M_min^beta),
+    # so M = M_min*(1 + u*((M_max/M_min)^beta - 1))^(1/beta).
+    # Written with expm1/log1p this stays accurate for alpha close to 1,
+    # where it turns into log-uniform sampling.
+    if abs(beta*log_ratio) < 1e-12:
+        scale = None
+    else:
+        scale = math.expm1(beta*log_ratio)
+    for start in range(0, N, chunk_size):
+        chunk = out[start:start+chunk_size]
+        rng.random(out=chunk)
+        if scale is None:
+            chunk *= log_ratio
+        else:
+            chunk *= scale
+            numpy.log1p(chunk, out=chunk)
+            chunk /= beta
+        numpy.exp(chunk, out=chunk)
+        chunk *= M_min
+    return out
+
+
+# Draw random samples from an arbitrary mass function by rejection sampling.
+# Candidates are drawn uniformly in logM (as for the Salpeter case) and
+# accepted with probability proportional to dN/dlogM.
+# N             ... number of samples.
+# logDensity    ... vectorised function returning log(dN/dlogM) (unnormalised)
+#                   for an array of masses.
+# M_min         ... lower bound of mass interval.
+# M_max         ... upper bound of mass interval.
+# logDensityMax ... upper bound of logDensity on [M_min,M_max]. If not given,
+#                   it is estimated on a fine logM grid.
+# rng           ... numpy Generator or seed.
+# out           ... optional preallocated float64 array of length N.
+# chunk_size    ... number of candidates drawn per chunk.
+def sampleByRejection(N, logDensity, M_min, M_max, logDensityMax=None,
+                      rng=None, out=None, chunk_size=CHUNK_SIZE):
+    rng = getGenerator(rng)
+    out = _prepareOutput(N, out)
+    log_M_min = math.log(M_min)
+    log_M_max = math.log(M_max)
+    if logDensityMax is None:
+        grid = numpy.exp(numpy.linspace(log_M_min, log_M_max, 10001))
+        logDensityMax = float(numpy.max(logDensity(grid)))
+    filled = 0
+    while filled < N:
+        # Draw candidates from logM interval.
+        logM = rng.uniform(log_M_min, log_M_max, chunk_size)
+        M    = numpy.exp(logM)
+        # Accept randomly, comparing in log space to avoid underflow.
+        logu   = numpy.log(rng.random(chunk_size))
+        accept = M[logu < logDensity(M) - logDensityMax]
+        n      = min(len(accept), N - filled)
+        out[filled:filled+n] = accept[:n]
+        filled = filled + n
+    return out
+
+
+# log(dN/dlogM) of the Salpeter IMF, i.e. (1-alpha)*log(M) up to a constant.
+# Handy as logDensity argument for sampleByRejection.
+def salpeterLogDensity(alpha):
+    def logDensity(M):
+        return (1.0 - alpha)*numpy.log(M)
+    return logDensity
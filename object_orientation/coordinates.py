@@ -0,0 +1,236 @@
+"""
+Sexagesimal coordinates for whole catalogue columns.
+
+Conversions between degrees and hours/degrees, minutes and seconds work on
+arrays. Formatting and parsing work on the bytes of fixed-width strings:
+the digits of all rows are computed at once as a (N, width) array of
+ASCII codes, which is then viewed as an array of byte strings. No Python
+code runs per row.
+
+2MASS-style designations such as 00424433+4116085 (RA 00h42m44.33s,
+dec +41d16m08.5s) are truncated, not rounded. parseDesignation returns the
+lower corner of the truncation cell, and formatDesignation reproduces the
+original string from it exactly. formatRA and formatDec round to the given
+precision and carry into minutes, degrees and hours properly (no 60.00
+seconds).
+"""
+import numpy
+
+# Tolerance (in units of the last digit) for floating-point values that
+# should be an exact multiple of it.
+_EPS = 1e-6
+
+
+# RA in degrees to hours, minutes, seconds (arrays; seconds are floats).
+# The remainders of divmod are exact (15 and 0.25 degrees are one hour and
+# one minute), so the seconds are rounded only once, by the final *240.
+def degreesToHMS(RA):
+    degrees = numpy.mod(numpy.asarray(RA, dtype=numpy.float64), 360.0)
+    hours, rest   = numpy.divmod(degrees, 15.0)
+    minutes, rest = numpy.divmod(rest, 0.25)
+    return hours.astype(numpy.int64), minutes.astype(numpy.int64), rest*240.0
+
+def hmsToDegrees(hours, minutes, seconds):
+    return 15.0*(numpy.asarray(hours) + numpy.asarray(minutes)/60.0
+                 + numpy.asarray(seconds)/3600.0)
+
+
+# dec in degrees to sign (+1/-1), degrees, arcminutes, arcseconds.
+def degreesToDMS(dec):
+    dec  = numpy.asarray(dec, dtype=numpy.float64)
+    sign = numpy.where(numpy.signbit(dec), -1, 1)
+    degrees, rest = numpy.divmod(numpy.abs(dec), 1.0)
+    minutes, rest = numpy.divmod(rest*60.0, 1.0)
+    return sign, degrees.astype(numpy.int64), minutes.astype(numpy.int64), rest*60.0
+
+def dmsToDegrees(sign, degrees, minutes, seconds):
+    return numpy.asarray(sign)*(numpy.asarray(degrees) + numpy.asarray(minutes)/60.0
+                                + numpy.asarray(seconds)/3600.0)
+
+
+# Split a number of units of the last digit into sexagesimal fields.
+# units ... integer array, e.g. RA in units of 0.01 seconds of time.
+# scale ... units per second (10**precision).
+def _splitUnits(units, scale):
+    perMinute = 60*scale
+    first  = units//(60*perMinute)
+    units  = units - first*60*perMinute
+    minute = units//perMinute
+    units  = units - minute*perMinute
+    return first, minute, units//scale, units % scale
+
+
+# Write non-negative integers with a fixed number of digits into columns
+# of a uint8 array of ASCII codes.
+def _putDigits(codes, start, values, width):
+    values = numpy.asarray(values, dtype=numpy.int64)
+    for i in range(width - 1, -1, -1):
+        codes[:,start+i] = 48 + values % 10
+        values = values//10
+
+# Read the integer formed by columns start..stop-1 of ASCII digits.
+def _getDigits(codes, start, stop):
+    value = numpy.zeros(len(codes), dtype=numpy.int64)
+    for i in range(start, stop):
+        value = 10*value + (codes[:,i].astype(numpy.int64) - 48)
+    return value
+
+# uint8 view (N, width) of an array of byte strings.
+def _asCodes(strings):
+    strings = numpy.asarray(strings)
+    if strings.dtype.kind == 'U':
+        strings = numpy.char.encode(strings, 'ascii')
+    strings = numpy.ascontiguousarray(strings.ravel())
+    width = strings.dtype.itemsize
+    return strings.view(numpy.uint8).reshape(len(strings), width)
+
+def _asStrings(codes):
+    return numpy.ascontiguousarray(codes).view('S%d' % codes.shape[1]).ravel()
+
+
+# Integer units of 10**-precision seconds, truncated or rounded.
+def _units(seconds, precision, rounded):
+    scaled = numpy.asarray(seconds)*10**precision
+    if rounded:
+        return numpy.floor(scaled + 0.5).astype(numpy.int64)
+    return numpy.floor(scaled + _EPS).astype(numpy.int64)
+
+
+# Format RA (degrees) as 'hh:mm:ss.ss' byte strings.
+# precision ... number of decimals of the seconds.
+# sep       ... separator, e.g. ':' or ' '.
+def formatRA(RA, precision=2, sep=':'):
+    scale = 10**precision
+    units = _units(numpy.mod(numpy.asarray(RA, dtype=numpy.float64), 360.0)*240.0,
+                   precision, True) % (24*3600*scale)
+    h, m, s, frac = _splitUnits(units, scale)
+    width = 8 + (precision + 1 if precision > 0 else 0)
+    codes = numpy.empty((units.size, width), dtype=numpy.uint8)
+    _putDigits(codes, 0, h.ravel(), 2)
+    codes[:,2] = ord(sep)
+    _putDigits(codes, 3, m.ravel(), 2)
+    codes[:,5] = ord(sep)
+    _putDigits(codes, 6, s.ravel(), 2)
+    if precision > 0:
+        codes[:,8] = ord('.')
+        _putDigits(codes, 9, frac.ravel(), precision)
+    return _asStrings(codes).reshape(units.shape)
+
+
+# Format dec (degrees) as '+dd:mm:ss.s' byte strings.
+def formatDec(dec, precision=1, sep=':'):
+    scale = 10**precision
+    dec   = numpy.asarray(dec, dtype=numpy.float64)
+    units = _units(numpy.abs(dec)*3600.0, precision, True)
+    d, m, s, frac = _splitUnits(units, scale)
+    width = 9 + (precision + 1 if precision > 0 else 0)
+    codes = numpy.empty((units.size, width), dtype=numpy.uint8)
+    codes[:,0] = numpy.where(numpy.signbit(dec) & (units > 0), ord('-'), ord('+')).ravel()
+    _putDigits(codes, 1, d.ravel(), 2)
+    codes[:,3] = ord(sep)
+    _putDigits(codes, 4, m.ravel(), 2)
+    codes[:,6] = ord(sep)
+    _putDigits(codes, 7, s.ravel(), 2)
+    if precision > 0:
+        codes[:,9] = ord('.')
+        _putDigits(codes, 10, frac.ravel(), precision)
+    return _asStrings(codes).reshape(units.shape)
+
+
+# Parse fixed-width sexagesimal strings 'xx?xx?xx[.fff]' with an optional
+# leading sign and any single-character separators, e.g. as written by
+# formatRA/formatDec. All strings must have the same layout.
+# Returns (sign, first, minutes, seconds).
+def _parseSexagesimal(strings):
+    codes = _asCodes(strings)
+    sign  = numpy.ones(len(codes), dtype=numpy.int64)
+    offset = 0
+    if len(codes) and codes[0,0] in (ord('+'), ord('-')):
+        sign   = numpy.where(codes[:,0] == ord('-'), -1, 1)
+        offset = 1
+    first   = _getDigits(codes, offset, offset + 2)
+    minutes = _getDigits(codes, offset + 3, offset + 5)
+    seconds = _getDigits(codes, offset + 6, offset + 8).astype(numpy.float64)
+    # Fractional digits, ignoring trailing padding.
+    width = codes.shape[1]
+    while width > offset + 8 and codes[0,width-1] in (0, ord(' ')):
+        width = width - 1
+    if width > offset + 9:
+        nFrac = width - offset - 9
+        seconds = seconds + _getDigits(codes, offset + 9, width)/float(10**nFrac)
+    return sign, first, minutes, seconds
+
+# RA strings 'hh:mm:ss.ss' to degrees.
+def parseRA(strings):
+    sign, h, m, s = _parseSexagesimal(strings)
+    return hmsToDegrees(h, m, s).reshape(numpy.shape(strings))
+
+# dec strings '+dd:mm:ss.s' to degrees.
+def parseDec(strings):
+    sign, d, m, s = _parseSexagesimal(strings)
+    return dmsToDegrees(sign, d, m, s).reshape(numpy.shape(strings))
+
+
+# Format 2MASS-style designations HHMMSSss+DDMMSSs (truncated, as 2MASS
+# does). raDigits/decDigits are the decimals of the seconds.
+def formatDesignation(RA, dec, raDigits=2, decDigits=1):
+    RA  = numpy.mod(numpy.asarray(RA, dtype=numpy.float64), 360.0)
+    dec = numpy.asarray(dec, dtype=numpy.float64)
+    raScale  = 10**raDigits
+    decScale = 10**decDigits
+    raUnits  = _units(RA*240.0, raDigits, False) % (24*3600*raScale)
+    decUnits = _units(numpy.abs(dec)*3600.0, decDigits, False)
+    h, m, s, f = _splitUnits(raUnits.ravel(), raScale)
+    d, dm, ds, df = _splitUnits(decUnits.ravel(), decScale)
+    width = 6 + raDigits + 1 + 6 + decDigits
+    codes = numpy.empty((raUnits.size, width), dtype=numpy.uint8)
+    _putDigits(codes, 0, h, 2)
+    _putDigits(codes, 2, m, 2)
+    _putDigits(codes, 4, s, 2)
+    _putDigits(codes, 6, f, raDigits)
+    i = 6 + raDigits
+    codes[:,i] = numpy.where(numpy.signbit(dec) & (decUnits > 0), ord('-'), ord('+')).ravel()
+    _putDigits(codes, i + 1, d, 2)
+    _putDigits(codes, i + 3, dm, 2)
+    _putDigits(codes, i + 5, ds, 2)
+    _putDigits(codes, i + 7, df, decDigits)
+    return _asStrings(codes).reshape(raUnits.shape)
+
+
+# Parse designations HHMMSSss+DDMMSSs, optionally preceded by 'J' or
+# '2MASS J'. All designations must have the same layout.
+# centre ... if True, return the centre of the truncation cell instead of
+#            its lower corner (a better estimate of the true position).
+# Returns (RA, dec) in degrees.
+def parseDesignation(designations, centre=False):
+    codes = _asCodes(designations)
+    shape = numpy.shape(designations)
+    if len(codes) == 0:
+        return numpy.zeros(shape), numpy.zeros(shape)
+    # Skip a prefix ending in 'J' (or up to the first digit), and trailing
+    # padding.
+    isJ = codes[0] == ord('J')
+    if numpy.any(isJ):
+        start = int(numpy.flatnonzero(isJ)[-1]) + 1
+    else:
+        start = int(numpy.argmax((codes[0] >= 48) & (codes[0] <= 57)))
+    codes = codes[:,start:]
+    width = codes.shape[1]
+    while width > 0 and codes[0,width-1] in (0, ord(' ')):
+        width = width - 1
+    isSign    = (codes[0,:width] == ord('+')) | (codes[0,:width] == ord('-'))
+    signPos   = int(numpy.argmax(isSign))
+    raDigits  = signPos - 6
+    decDigits = width - signPos - 7
+    raScale   = 10**raDigits
+    decScale  = 10**decDigits
+    raUnits = (_getDigits(codes, 0, 2)*3600*raScale + _getDigits(codes, 2, 4)*60*raScale
+               + _getDigits(codes, 4, signPos))
+    decUnits = (_getDigits(codes, signPos + 1, signPos + 3)*3600*decScale
+                + _getDigits(codes, signPos + 3, signPos + 5)*60*decScale
+                + _getDigits(codes, signPos + 5, width))
+    half = 0.5 if centre else 0.0
+    RA   = (raUnits + half)/(240.0*raScale)
+    sign = numpy.where(codes[:,signPos] == ord('-'), -1.0, 1.0)
+    dec  = sign*(decUnits + half)/(3600.0*decScale)
+    return RA.reshape(shape), dec.reshape(shape)
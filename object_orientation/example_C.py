@@ -1,3 +1,5 @@
+from reddening import calcReddening
+
 class Star(object):
     def __init__(self, name, RA, dec, Jmag, Hmag, Kmag, SpT):
         self.__name = name
@@ -0,0 +1,21 @@
+from star_catalog import StarCatalog
+
+# The stars of example_C.py, stored column by column.
+catalog = StarCatalog.fromRows([
+    ('TWHya', 165.46625, -34.7047, 8.2, 7.6, 7.3, 'K7V'),
+    ('AlphaBoo', 213.91529, 19.1824, -2.25, -2.81, -2.91, 'K1III'),
+    ('TTauri', 65.495, 19.535, 7.24, 6.24, 5.32, 'G5V'),
+])
+
+# Whole columns at once instead of a loop over getJmag()/getKmag().
+print(catalog['Jmag'] - catalog['Kmag'])
+
+# Selection with a boolean mask, and sorting by Right Ascension.
+print(list(catalog[catalog['dec'] > 0.0]))
+print(list(catalog.sorted('RA')))
+
+# Single stars are views of one row, with the getters of example_C.py.
+star = catalog[0]
+print(star.getName(), star.get_RA(segFlag=True))
+star.setJmag(8.3)
+print(catalog['Jmag'])
@@ -0,0 +1,168 @@
+"""
+Visual extinction from near-infrared colours and spectral types.
+
+The observed J-H and H-K colours of a star are its intrinsic colours, which
+depend on the spectral type, reddened by dust:
+
+   E(J-H) = (J-H) - (J-H)_0 = 0.107 Av,   E(H-K) = (H-K) - (H-K)_0 = 0.063 Av
+
+(extinction law of Rieke & Lebofsky 1985). Spectral types such as 'K7V' or
+'K1III' are parsed into integer arrays (class, luminosity class) and a
+float subclass. Only the distinct strings are parsed, which for a catalogue
+are a few hundred at most. The intrinsic colours are tabulated on a regular
+grid of spectral codes (10*class + subclass), so looking them up for all
+stars is plain array indexing.
+
+The intrinsic colours below are approximate values after Pecaut & Mamajek
+(2013) for dwarfs and Bessell & Brett (1988) for giants.
+"""
+import numpy,re
+
+SPECTRAL_CLASSES = 'OBAFGKM'
+
+LUMINOSITY_CLASSES = {'0': 1, 'Ia': 1, 'Iab': 1, 'Ib': 1, 'I': 1, 'II': 2,
+                      'III': 3, 'IV': 4, 'V': 5, 'VI': 6}
+
+# Extinction in J, H and K relative to V (Rieke & Lebofsky 1985).
+A_J = 0.282
+A_H = 0.175
+A_K = 0.112
+
+# Spectral code, (J-H)_0, (H-K)_0 of dwarfs (luminosity class IV-VI).
+DWARF_COLOURS = ((9.0, -0.14, -0.07),    # O9
+                 (10.0, -0.12, -0.05),   # B0
+                 (15.0, -0.06, -0.03),   # B5
+                 (20.0, 0.00, 0.00),     # A0
+                 (25.0, 0.06, 0.02),     # A5
+                 (30.0, 0.13, 0.03),     # F0
+                 (35.0, 0.23, 0.04),     # F5
+                 (40.0, 0.29, 0.05),     # G0
+                 (45.0, 0.34, 0.07),     # G5
+                 (50.0, 0.41, 0.09),     # K0
+                 (55.0, 0.57, 0.13),     # K5
+                 (57.0, 0.62, 0.16),     # K7
+                 (60.0, 0.64, 0.18),     # M0
+                 (62.0, 0.60, 0.21),     # M2
+                 (65.0, 0.58, 0.30),     # M5
+                 (69.0, 0.70, 0.45))     # M9
+
+# The same for giants (luminosity class I-III). Earlier than G they are
+# close to the dwarf colours, which are used there.
+GIANT_COLOURS = ((40.0, 0.29, 0.05),     # G0
+                 (48.0, 0.47, 0.10),     # G8
+                 (50.0, 0.50, 0.10),     # K0
+                 (51.0, 0.54, 0.11),     # K1
+                 (53.0, 0.66, 0.13),     # K3
+                 (55.0, 0.78, 0.17),     # K5
+                 (60.0, 0.82, 0.19),     # M0
+                 (62.0, 0.85, 0.22),     # M2
+                 (63.0, 0.87, 0.24),     # M3
+                 (65.0, 0.88, 0.29))     # M5
+
+_spectralType = re.compile(r'\s*([OBAFGKM])\s*(\d+(?:\.\d*)?)?\s*(Iab|Ia|Ib|VI|IV|V|III|II|I|0)?')
+
+
+# Parse one spectral type. Returns (class, subclass, luminosity class), with
+# class -1 if it cannot be parsed and luminosity class 0 if none is given.
+def parseSpectralType(SpT):
+    if isinstance(SpT, bytes):
+        SpT = SpT.decode('ascii')
+    match = _spectralType.match(SpT)
+    if match is None:
+        return -1, numpy.nan, 0
+    spClass  = SPECTRAL_CLASSES.index(match.group(1))
+    subclass = float(match.group(2)) if match.group(2) else 0.0
+    lumClass = LUMINOSITY_CLASSES.get(match.group(3), 0)
+    return spClass, subclass, lumClass
+
+
+# Parse an array of spectral types. Every distinct string is parsed once.
+# Returns the arrays (class int8, subclass float32, luminosity class int8).
+def parseSpectralTypes(SpT):
+    unique, inverse = numpy.unique(numpy.asarray(SpT), return_inverse=True)
+    parsed = [parseSpectralType(s) for s in unique]
+    spClass  = numpy.array([p[0] for p in parsed], dtype=numpy.int8)[inverse]
+    subclass = numpy.array([p[1] for p in parsed], dtype=numpy.float32)[inverse]
+    lumClass = numpy.array([p[2] for p in parsed], dtype=numpy.int8)[inverse]
+    shape = numpy.shape(SpT)
+    return spClass.reshape(shape), subclass.reshape(shape), lumClass.reshape(shape)
+
+
+class IntrinsicColours(object):
+
+    # Tables of (J-H)_0 and (H-K)_0 for dwarfs and giants on a regular grid
+    # of spectral codes with the given step, interpolated linearly between
+    # the values of DWARF_COLOURS and GIANT_COLOURS.
+    def __init__(self, step=0.1):
+        self.step  = step
+        self.codes = numpy.arange(0.0, 70.0 + step/2, step)
+        dwarf = numpy.array(DWARF_COLOURS)
+        giant = numpy.array(GIANT_COLOURS)
+        self.dwarfJH = numpy.interp(self.codes, dwarf[:,0], dwarf[:,1])
+        self.dwarfHK = numpy.interp(self.codes, dwarf[:,0], dwarf[:,2])
+        early = self.codes < giant[0,0]
+        self.giantJH = numpy.where(early, self.dwarfJH,
+                                   numpy.interp(self.codes, giant[:,0], giant[:,1]))
+        self.giantHK = numpy.where(early, self.dwarfHK,
+                                   numpy.interp(self.codes, giant[:,0], giant[:,2]))
+
+    # Intrinsic colours for arrays of parsed spectral types. Unparsed types
+    # give NaN.
+    def lookup(self, spClass, subclass, lumClass):
+        code  = 10.0*spClass + subclass
+        index = numpy.clip(numpy.rint(code/self.step), 0, len(self.codes) - 1)
+        index = numpy.where(numpy.isfinite(index), index, 0).astype(numpy.intp)
+        giant = (lumClass >= 1) & (lumClass <= 3)
+        JH = numpy.where(giant, self.giantJH[index], self.dwarfJH[index])
+        HK = numpy.where(giant, self.giantHK[index], self.dwarfHK[index])
+        bad = spClass < 0
+        return numpy.where(bad, numpy.nan, JH), numpy.where(bad, numpy.nan, HK)
+
+
+# The table is built on first use and then kept.
+_table = []
+
+def intrinsicColours():
+    if not _table:
+        _table.append(IntrinsicColours())
+    return _table[0]
+
+
+# Visual extinction Av from J, H, K magnitudes and spectral types.
+# Jmag, Hmag, Kmag ... magnitudes (scalars or arrays).
+# SpT              ... spectral types, strings or the tuple returned by
+#                      parseSpectralTypes (to avoid parsing them again).
+# colours          ... 'both' combines E(J-H) and E(H-K) by least squares,
+#                      'JH' or 'HK' uses only one colour excess.
+# Returns Av (a float for scalar input); NaN for unknown spectral types.
+def calcReddening(Jmag, Hmag, Kmag, SpT, colours='both'):
+    if isinstance(SpT, tuple):
+        spClass, subclass, lumClass = SpT
+    else:
+        spClass, subclass, lumClass = parseSpectralTypes(SpT)
+    JH0, HK0 = intrinsicColours().lookup(spClass, subclass, lumClass)
+    Jmag = numpy.asarray(Jmag, dtype=numpy.float64)
+    Hmag = numpy.asarray(Hmag, dtype=numpy.float64)
+    Kmag = numpy.asarray(Kmag, dtype=numpy.float64)
+    excessJH = (Jmag - Hmag) - JH0
+    excessHK = (Hmag - Kmag) - HK0
+    rJH = A_J - A_H
+    rHK = A_H - A_K
+    if colours == 'JH':
+        Av = excessJH/rJH
+    elif colours == 'HK':
+        Av = excessHK/rHK
+    elif colours == 'both':
+        Av = (rJH*excessJH + rHK*excessHK)/(rJH*rJH + rHK*rHK)
+    else:
+        raise ValueError("colours must be 'both', 'JH' or 'HK'")
+    if Av.ndim == 0:
+        return float(Av)
+    return Av
+
+
+# Compute Av of all stars of a StarCatalog and store it in its Av column.
+def computeReddening(catalog, colours='both'):
+    catalog['Av'][:] = calcReddening(catalog['Jmag'], catalog['Hmag'], catalog['Kmag'],
+                                     catalog['SpT'], colours)
+    return catalog['Av']
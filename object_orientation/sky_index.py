@@ -0,0 +1,116 @@
+"""
+Spatial index of sky positions for cone searches and cross-matching.
+
+Sorting a list of Star objects by RA (example_C.py) is no help for
+positional queries: every cone search is still a loop over all stars.
+SkyIndex converts RA/dec to unit vectors and builds a k-d tree on them
+(scipy.spatial.cKDTree). An angular radius r corresponds to the straight
+(chord) distance 2*sin(r/2) between unit vectors, so cone searches,
+nearest-neighbour look-ups and cross-matches become tree queries, with no
+special cases at the poles or at RA = 0/360.
+"""
+import numpy,pickle
+from scipy.spatial import cKDTree
+
+
+# Unit vectors (N, 3) of RA, dec in degrees.
+def unitVectors(RA, dec):
+    RA  = numpy.radians(numpy.asarray(RA, dtype=numpy.float64))
+    dec = numpy.radians(numpy.asarray(dec, dtype=numpy.float64))
+    cosDec = numpy.cos(dec)
+    return numpy.stack([cosDec*numpy.cos(RA), cosDec*numpy.sin(RA), numpy.sin(dec)],
+                       axis=-1)
+
+
+# Chord length between unit vectors separated by angle (degrees), and back.
+def chordLength(angle):
+    return 2.0*numpy.sin(numpy.radians(numpy.asarray(angle, dtype=numpy.float64))/2.0)
+
+def chordToAngle(chord):
+    return numpy.degrees(2.0*numpy.arcsin(numpy.minimum(numpy.asarray(chord)/2.0, 1.0)))
+
+
+# Angular separation in degrees, accurate also for very small separations.
+def separation(RA1, dec1, RA2, dec2):
+    return chordToAngle(numpy.sqrt(numpy.sum((unitVectors(RA1, dec1)
+                                              - unitVectors(RA2, dec2))**2, axis=-1)))
+
+
+# Order of positions such that neighbours on the sky are close in memory:
+# sorted by cells of cellSize degrees, dec band by dec band. Queries in this
+# order reuse the same branches of the tree and run about twice as fast.
+def spatialOrder(RA, dec, cellSize=0.5):
+    band = numpy.floor((numpy.asarray(dec) + 90.0)/cellSize).astype(numpy.int64)
+    cell = numpy.floor(numpy.mod(RA, 360.0)/cellSize).astype(numpy.int64)
+    return numpy.argsort(band*int(numpy.ceil(360.0/cellSize) + 1) + cell, kind='stable')
+
+
+class SkyIndex(object):
+
+    # RA, dec   ... positions in degrees.
+    # leafsize  ... number of points in the leaves of the tree.
+    def __init__(self, RA, dec, leafsize=16):
+        self.RA   = numpy.asarray(RA, dtype=numpy.float64)
+        self.dec  = numpy.asarray(dec, dtype=numpy.float64)
+        self.tree = cKDTree(unitVectors(self.RA, self.dec), leafsize=leafsize,
+                            balanced_tree=False, compact_nodes=False)
+
+    # Index of the RA/dec columns of a StarCatalog.
+    @classmethod
+    def fromCatalog(cls, catalog, leafsize=16):
+        return cls(catalog['RA'], catalog['dec'], leafsize)
+
+    def __len__(self):
+        return len(self.RA)
+
+    # Save the index (positions and tree) to a file, so it is built only once.
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
+    # Indices of all stars within radius (degrees) of (RA, dec). For arrays
+    # of centres a list of index arrays is returned, one per centre.
+    # workers ... number of threads (-1: all CPUs).
+    def coneSearch(self, RA, dec, radius, workers=1):
+        scalar = numpy.ndim(RA) == 0 and numpy.ndim(dec) == 0
+        result = self.tree.query_ball_point(unitVectors(RA, dec), chordLength(radius),
+                                            workers=workers, return_sorted=True)
+        if scalar:
+            return numpy.array(result, dtype=numpy.int64)
+        return [numpy.array(r, dtype=numpy.int64) for r in result]
+
+    # The k nearest stars of every position. Returns (separation in degrees,
+    # index), each of shape (..., k) (or (...) for k=1).
+    def nearest(self, RA, dec, k=1, workers=1):
+        distance, index = self.tree.query(unitVectors(RA, dec), k=k, workers=workers)
+        return chordToAngle(distance), index
+
+    # Cross-match other positions against this index: for every position
+    # (RA, dec) find the nearest star of the index within radius (degrees).
+    # Returns (otherIndex, index, separation): the positions that have a
+    # match, their counterparts in this index and the separations in degrees.
+    def crossMatch(self, RA, dec, radius, workers=-1):
+        RA  = numpy.asarray(RA, dtype=numpy.float64)
+        dec = numpy.asarray(dec, dtype=numpy.float64)
+        order = spatialOrder(RA, dec)
+        distance = numpy.empty(len(order))
+        index    = numpy.empty(len(order), dtype=numpy.int64)
+        distance[order], index[order] = self.tree.query(unitVectors(RA[order], dec[order]),
+                                                        k=1, workers=workers,
+                                                        distance_upper_bound=chordLength(radius))
+        # Unmatched positions get distance inf and index len(self).
+        matched = numpy.flatnonzero(numpy.isfinite(distance))
+        return matched, index[matched], chordToAngle(distance[matched])
+
+    # Cross-match with another SkyIndex or StarCatalog.
+    def crossMatchCatalog(self, other, radius, workers=-1):
+        if isinstance(other, SkyIndex):
+            RA, dec = other.RA, other.dec
+        else:
+            RA, dec = other['RA'], other['dec']
+        return self.crossMatch(RA, dec, radius, workers)
@@ -0,0 +1,219 @@
+"""
+Columnar star catalogue.
+
+A list of Star objects (see example_C.py) costs several hundred bytes per
+star and every calculation becomes a Python loop over getter functions.
+StarCatalog instead keeps one typed NumPy array per quantity:
+
+   catalog['Jmag'] - catalog['Kmag']      # J-K colour of all stars
+   bright = catalog[catalog['Jmag'] < 10] # selection with a boolean mask
+   first  = catalog[:1000]                # slices share memory, no copy
+
+Star is a lightweight view of one row, with the same getter/setter
+functions as the Star class of example_C.py, for code that wants to work
+with one star at a time. Names and spectral types are stored as ASCII byte
+strings; the Star view decodes them.
+"""
+import numpy
+
+from coordinates import degreesToHMS
+
+
+# Column names and types. Names and spectral types are fixed-width byte
+# strings, their width is chosen when the catalogue is built.
+COLUMNS = (('name', 'S'),
+           ('RA',   numpy.float64),   # degrees
+           ('dec',  numpy.float64),   # degrees
+           ('Jmag', numpy.float32),
+           ('Hmag', numpy.float32),
+           ('Kmag', numpy.float32),
+           ('SpT',  'S'),
+           ('Av',   numpy.float32))   # visual extinction
+
+COLUMN_NAMES = tuple(name for name, dtype in COLUMNS)
+
+
+class StarCatalog(object):
+
+    # One argument per column, each an array (or list) of equal length.
+    # Av defaults to 0.
+    def __init__(self, name, RA, dec, Jmag, Hmag, Kmag, SpT, Av=None):
+        if Av is None:
+            Av = numpy.zeros(len(RA), dtype=numpy.float32)
+        values = (name, RA, dec, Jmag, Hmag, Kmag, SpT, Av)
+        self._columns = {}
+        for (column, dtype), value in zip(COLUMNS, values):
+            # numpy.asarray does not copy arrays that already have the
+            # right type, so slices of another catalogue stay views.
+            if dtype == 'S' and not (isinstance(value, numpy.ndarray) and value.dtype.kind == 'S'):
+                value = numpy.char.encode(numpy.asarray(value, dtype=str), 'ascii')
+            elif dtype != 'S':
+                value = numpy.asarray(value, dtype=dtype)
+            self._columns[column] = value
+        lengths = set(len(value) for value in self._columns.values())
+        if len(lengths) > 1:
+            raise ValueError("all columns must have the same length")
+
+    # Build a catalogue from rows (name, RA, dec, Jmag, Hmag, Kmag, SpT),
+    # i.e. the arguments of the Star class in example_C.py.
+    @classmethod
+    def fromRows(cls, rows):
+        rows = list(rows)
+        if not rows:
+            return cls.empty(0)
+        return cls(*zip(*rows))
+
+    # Catalogue of n stars with zero/empty entries, e.g. to be filled by a
+    # reader chunk by chunk.
+    @classmethod
+    def empty(cls, n, nameLength=16, sptLength=8):
+        columns = []
+        for column, dtype in COLUMNS[:-1]:
+            if column == 'name':
+                dtype = 'S%d' % nameLength
+            elif column == 'SpT':
+                dtype = 'S%d' % sptLength
+            columns.append(numpy.zeros(n, dtype=dtype))
+        return cls(*columns)
+
+    # Join several catalogues into a new one.
+    @classmethod
+    def concatenate(cls, catalogs):
+        return cls(*[numpy.concatenate([c[column] for c in catalogs])
+                     for column in COLUMN_NAMES])
+
+    def __len__(self):
+        return len(self._columns['RA'])
+
+    # catalog['RA']       ... column array (no copy).
+    # catalog[i]          ... Star view of row i.
+    # catalog[10:20]      ... catalogue of a slice (views, no copy).
+    # catalog[mask], catalog[indices] ... catalogue of the selected rows.
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._columns[key]
+        if isinstance(key, (int, numpy.integer)):
+            if key < 0:
+                key = key + len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("star index out of range")
+            return Star(self, key)
+        return StarCatalog(*[self._columns[column][key] for column in COLUMN_NAMES])
+
+    # Columns are also available as attributes, e.g. catalog.RA.
+    def __getattr__(self, name):
+        columns = self.__dict__.get('_columns')
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Star(self, i)
+
+    def __repr__(self):
+        return 'StarCatalog(%d stars)' % len(self)
+
+    # Memory used by the columns in bytes.
+    @property
+    def nbytes(self):
+        return sum(value.nbytes for value in self._columns.values())
+
+    # Compute Av of all stars from their colours and spectral types in one
+    # pass, see reddening.py.
+    def computeReddening(self, colours='both'):
+        from reddening import computeReddening
+        return computeReddening(self, colours)
+
+    # Catalogue sorted by a column (RA by default, like sorting a list of
+    # Star objects in example_C.py).
+    def sorted(self, column='RA'):
+        return self[numpy.argsort(self._columns[column], kind='stable')]
+
+
+class Star(object):
+
+    # View of row index of a StarCatalog. Reading and writing goes directly
+    # to the catalogue's arrays; __slots__ keeps the view itself small.
+    __slots__ = ('_catalog', '_index')
+
+    def __init__(self, catalog, index):
+        self._catalog = catalog
+        self._index   = index
+
+    def _get(self, column):
+        return self._catalog._columns[column][self._index]
+
+    def _set(self, column, value):
+        self._catalog._columns[column][self._index] = value
+
+    # The following functions return values for internal variables
+    def getName(self):
+        return self._get('name').decode('ascii')
+
+    def get_RA(self, segFlag=False):
+        RA = self.getRA()
+        if segFlag:
+            hours, minutes, seconds = degreesToHMS(RA)
+            return (int(hours), int(minutes), float(seconds))
+        else:
+            return RA
+
+    def getRA(self):
+        return float(self._get('RA'))
+
+    def getdec(self):
+        return float(self._get('dec'))
+
+    def getJmag(self):
+        return float(self._get('Jmag'))
+
+    def getHmag(self):
+        return float(self._get('Hmag'))
+
+    def getKmag(self):
+        return float(self._get('Kmag'))
+
+    def getSpT(self):
+        return self._get('SpT').decode('ascii')
+
+    def getAv(self):
+        return float(self._get('Av'))
+
+    # The following functions set/modify values for internal variables.
+    # Strings longer than the column width are truncated.
+    def setName(self, name):
+        self._set('name', name.encode('ascii'))
+
+    def setRA(self, RA):
+        self._set('RA', RA)
+
+    def setdec(self, dec):
+        self._set('dec', dec)
+
+    def setJmag(self, Jmag):
+        self._set('Jmag', Jmag)
+
+    def setHmag(self, Hmag):
+        self._set('Hmag', Hmag)
+
+    def setKmag(self, Kmag):
+        self._set('Kmag', Kmag)
+
+    def setSpT(self, SpT):
+        self._set('SpT', SpT.encode('ascii'))
+
+    # The following functions perform internal calculations
+    def computeReddening(self):
+        from reddening import calcReddening
+        self._set('Av', calcReddening(self.getJmag(), self.getHmag(), self.getKmag(),
+                                      self.getSpT()))
+
+    def __repr__(self):
+        return '%s: %f' % (self.getName(), self.getRA())
+
+    def __lt__(self, other):
+        if isinstance(other, float):
+            return self.getRA() < other
+        else:
+            return self.getRA() < other.getRA()
@@ -0,0 +1,314 @@
+"""
+Fast reader for fixed-width ASCII catalogues such as data.txt.
+
+VizieR/2MASS-style tables start with a few header lines (column names and
+units) followed by a ruler of dashes that marks the extent of every column:
+
+    RAJ        DEJ                          Jmag   e_Jmag
+    2000 (deg) 2000 (deg) 2MASS             (mag)  (mag)
+    ---------- ---------- ----------------- ------ ------
+    010.684737 +41.269035 00424433+4116085   9.453  0.052
+
+readFormat takes the column boundaries from the ruler, the names (here
+RAJ2000, DEJ2000, 2MASS, Jmag, e_Jmag) and units from the header, and the
+types from the first block of data. The data are then read in large blocks
+of bytes; every block is turned into a (lines, width) array of characters,
+from which whole columns are cut and converted by NumPy. iterCatalog yields
+one typed structured array per block, readCatalog returns the whole table
+and can keep a binary copy (a .npy file next to the catalogue) that later
+calls simply memory-map.
+"""
+import numpy,os
+
+# Bytes read per block.
+CHUNK_BYTES = 16*1024*1024
+
+
+class FixedWidthFormat(object):
+
+    # names, units ... column names and units ('' if none).
+    # starts, stops ... character range of every column.
+    # dtypes        ... NumPy type of every column.
+    # dataOffset    ... byte offset of the first data line in the file.
+    def __init__(self, names, units, starts, stops, dtypes, dataOffset):
+        self.names      = names
+        self.units      = units
+        self.starts     = starts
+        self.stops      = stops
+        self.dtypes     = dtypes
+        self.dataOffset = dataOffset
+
+    @property
+    def width(self):
+        return max(self.stops)
+
+    @property
+    def dtype(self):
+        return numpy.dtype(list(zip(self.names, self.dtypes)))
+
+    def __repr__(self):
+        columns = ', '.join('%s[%d:%d] %s' % (n, a, b, numpy.dtype(t).str)
+                            for n, a, b, t in zip(self.names, self.starts,
+                                                  self.stops, self.dtypes))
+        return 'FixedWidthFormat(%s)' % columns
+
+
+def _isRuler(line):
+    stripped = line.strip()
+    return len(stripped) > 0 and set(stripped) <= set(b'- ')
+
+# Column ranges from the runs of dashes of the ruler line.
+def _columnRanges(ruler):
+    starts, stops = [], []
+    inside = False
+    for i, c in enumerate(ruler + b' '):
+        if c == ord('-') and not inside:
+            starts.append(i)
+            inside = True
+        elif c != ord('-') and inside:
+            stops.append(i)
+            inside = False
+    return starts, stops
+
+# Name and unit of a column from the header text above it. Text in
+# parentheses is the unit, the rest (over all lines) is the name.
+def _nameAndUnit(texts):
+    name, unit = '', ''
+    for text in texts:
+        for token in text.split():
+            if token.startswith('(') and token.endswith(')'):
+                unit = token[1:-1]
+            else:
+                name = name + token
+    return name, unit
+
+
+# Cut a block of complete lines (bytes) into a (lines, width) array of
+# characters, padding short lines with blanks and dropping empty lines.
+def _characterMatrix(block, width):
+    buf  = numpy.frombuffer(block, dtype=numpy.uint8)
+    if len(buf) == 0:
+        return numpy.empty((0, width), dtype=numpy.uint8)
+    ends = numpy.flatnonzero(buf == ord('\n'))
+    if len(buf) and buf[-1] != ord('\n'):
+        ends = numpy.append(ends, len(buf))
+    starts  = numpy.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts
+    # Windows line ends.
+    cr = (lengths > 0) & (buf[numpy.maximum(ends - 1, 0)] == ord('\r'))
+    lengths = lengths - cr
+    if numpy.all(lengths == width) and numpy.all(numpy.diff(starts) == width + 1 + cr[0]):
+        # All lines have the same length: the block is already a matrix.
+        stride = width + 1 + int(cr[0])
+        codes  = numpy.lib.stride_tricks.as_strided(buf, (len(starts), width), (stride, 1))
+        codes  = codes.copy()
+    else:
+        # Ragged lines: copy the characters of every line into a matrix of
+        # blanks with a boolean mask on each side (only uint8 and bool
+        # temporaries, no index arrays of the block size).
+        keep = numpy.ones(len(buf), dtype=bool)
+        keep[ends[ends < len(buf)]] = False
+        keep[(ends - 1)[cr]] = False
+        long = lengths > width
+        if numpy.any(long):
+            # Characters beyond the width are dropped.
+            cut = numpy.zeros(len(buf) + 1, dtype=numpy.int8)
+            cut[starts[long] + width] = 1
+            cut[ends[long]] = -1
+            keep &= numpy.cumsum(cut[:-1], dtype=numpy.int8) == 0
+        filled = numpy.arange(width)[None,:] < numpy.minimum(lengths, width)[:,None]
+        codes  = numpy.full((len(starts), width), ord(' '), dtype=numpy.uint8)
+        codes[filled] = buf[keep]
+    return codes[~numpy.all(codes == ord(' '), axis=1)]
+
+# Column a:b of the character matrix as fixed-width byte strings.
+def _field(codes, a, b):
+    return numpy.ascontiguousarray(codes[:,a:b]).view('S%d' % (b - a)).ravel()
+
+
+# Type of a column from a sample of its fields: int64, float64 (blanks
+# become NaN) or a byte string of the column width.
+def _inferType(fields, blank, width):
+    values = fields[~blank]
+    if not numpy.any(blank):
+        try:
+            values.astype(numpy.int64)
+            return numpy.int64
+        except ValueError:
+            pass
+    try:
+        values.astype(numpy.float64)
+        return numpy.float64
+    except ValueError:
+        return 'S%d' % width
+
+
+# Numbers with the decimal point in the same position in every row (such as
+# '%6.3f' columns) are converted with integer arithmetic on the digits:
+# mantissa/10^k is correctly rounded, just like float(text). Returns None
+# if the column does not have this layout.
+def _fixedDecimal(codes):
+    # One contiguous row per character position.
+    rows = numpy.ascontiguousarray(codes.T)
+    w, n = rows.shape
+    dots = [j for j in range(w) if numpy.all(rows[j] == ord('.'))]
+    if len(dots) != 1 or w - 1 > 15:
+        return None
+    dot  = dots[0]
+    mantissa = numpy.zeros(n, dtype=numpy.int64)
+    negative = numpy.zeros(n, dtype=bool)
+    started  = numpy.zeros(n, dtype=bool)
+    for j in range(w):
+        if j == dot:
+            continue
+        digit = rows[j] - numpy.uint8(ord('0'))
+        isDigit = digit <= 9
+        if j > dot:
+            if not numpy.all(isDigit):
+                return None
+        else:
+            # Blanks, then at most one sign, then digits.
+            isSign = (rows[j] == ord('+')) | (rows[j] == ord('-'))
+            if not numpy.all(numpy.where(started, isDigit,
+                                         isDigit | isSign | (rows[j] == ord(' ')))):
+                return None
+            negative = negative | (rows[j] == ord('-'))
+            started  = started | isDigit | isSign
+            digit    = numpy.where(isDigit, digit, 0)
+        mantissa = 10*mantissa + digit
+    values = mantissa/float(10**(w - dot - 1))
+    values[negative] = -values[negative]
+    return values
+
+
+# Convert the columns of a character matrix into a structured array.
+def _convert(codes, fmt):
+    out = numpy.empty(len(codes), dtype=fmt.dtype)
+    for name, a, b, dtype in zip(fmt.names, fmt.starts, fmt.stops, fmt.dtypes):
+        fields = _field(codes, a, b)
+        if numpy.dtype(dtype).kind == 'S':
+            out[name] = numpy.char.strip(fields)
+            continue
+        blank = numpy.all(codes[:,a:b] == ord(' '), axis=1)
+        if numpy.dtype(dtype).kind == 'f':
+            values = _fixedDecimal(codes[~blank,a:b] if numpy.any(blank) else codes[:,a:b])
+            if values is not None:
+                out[name][~blank] = values
+                out[name][blank]  = numpy.nan
+                continue
+        if numpy.any(blank):
+            if numpy.dtype(dtype).kind != 'f':
+                raise ValueError("blank entry in integer column %s" % name)
+            fields = fields.copy()
+            fields[blank] = b'nan'
+        out[name] = fields.astype(dtype)
+    return out
+
+
+# Blocks of complete data lines, as bytes.
+def _lineBlocks(filename, offset, chunkBytes):
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        rest = b''
+        while True:
+            block = f.read(chunkBytes)
+            if not block:
+                break
+            block = rest + block
+            end   = block.rfind(b'\n')
+            if end < 0:
+                rest = block
+                continue
+            rest = block[end+1:]
+            yield block[:end+1]
+        if rest.strip():
+            yield rest
+
+
+# Read the header of a catalogue and infer its format.
+# sampleBytes ... amount of data used to infer the column types.
+def readFormat(filename, sampleBytes=1024*1024):
+    header = []
+    offset = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            offset = offset + len(line)
+            line = line.rstrip(b'\r\n')
+            if _isRuler(line):
+                break
+            header.append(line)
+        else:
+            raise ValueError("%s has no ruler line of dashes" % filename)
+    starts, stops = _columnRanges(line)
+    names, units = [], []
+    for i, (a, b) in enumerate(zip(starts, stops)):
+        name, unit = _nameAndUnit([h[a:b].decode('ascii', 'replace') for h in header])
+        if not name or name in names:
+            name = 'col%d' % (i + 1)
+        names.append(name)
+        units.append(unit)
+    fmt = FixedWidthFormat(names, units, starts, stops, [None]*len(names), offset)
+    sample = next(_lineBlocks(filename, offset, sampleBytes), b'')
+    codes  = _characterMatrix(sample, fmt.width)
+    for i, (a, b) in enumerate(zip(starts, stops)):
+        blank = numpy.all(codes[:,a:b] == ord(' '), axis=1)
+        fmt.dtypes[i] = _inferType(_field(codes, a, b), blank, b - a)
+    return fmt
+
+
+# Read a catalogue block by block, yielding one structured array per block
+# (about chunkBytes of text each).
+def iterCatalog(filename, fmt=None, chunkBytes=CHUNK_BYTES):
+    if fmt is None:
+        fmt = readFormat(filename)
+    for block in _lineBlocks(filename, fmt.dataOffset, chunkBytes):
+        codes = _characterMatrix(block, fmt.width)
+        if len(codes):
+            yield _convert(codes, fmt)
+
+
+# .npy header of exactly length bytes for a 1-D array of n records.
+def _npyHeader(dtype, n, length=None):
+    header = repr({'descr': numpy.lib.format.dtype_to_descr(dtype),
+                   'fortran_order': False, 'shape': (n,)})
+    if length is None:
+        length = ((10 + len(header) + 1 + 63)//64)*64
+    text = header + ' '*(length - 10 - len(header) - 1) + '\n'
+    return (numpy.lib.format.MAGIC_PREFIX + b'\x01\x00'
+            + numpy.uint16(len(text)).astype('<u2').tobytes() + text.encode('latin1'))
+
+
+# Parse the catalogue into a .npy file, streaming: the header is written
+# with room for any number of rows and completed at the end.
+def _writeCache(filename, cacheName, fmt, chunkBytes):
+    length    = len(_npyHeader(fmt.dtype, 10**18))
+    temporary = cacheName + '.%d.tmp' % os.getpid()
+    n = 0
+    with open(temporary, 'wb') as f:
+        f.write(b'\0'*length)
+        for block in iterCatalog(filename, fmt, chunkBytes):
+            f.write(block.tobytes())
+            n = n + len(block)
+        f.seek(0)
+        f.write(_npyHeader(fmt.dtype, n, length))
+    os.replace(temporary, cacheName)
+
+
+# Read a whole catalogue into a structured array.
+# cache ... keep a binary copy in filename+'.npy'. If it exists and is newer
+#           than the catalogue, it is memory-mapped instead of parsing the
+#           text again (the returned array is then read-only).
+# A catalogue without data rows gives an empty array of the catalogue dtype
+# (all columns int64, as there are no values to infer the types from).
+def readCatalog(filename, cache=False, chunkBytes=CHUNK_BYTES):
+    if not cache:
+        fmt    = readFormat(filename)
+        blocks = list(iterCatalog(filename, fmt, chunkBytes))
+        if not blocks:
+            return numpy.empty(0, dtype=fmt.dtype)
+        return numpy.concatenate(blocks)
+    cacheName = filename + '.npy'
+    if not (os.path.exists(cacheName)
+            and os.path.getmtime(cacheName) >= os.path.getmtime(filename)):
+        _writeCache(filename, cacheName, readFormat(filename), chunkBytes)
+    return numpy.load(cacheName, mmap_mode='r')